@@ -1,14 +1,98 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from functools import cached_property
+
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 
-# Load cleaned data
-df_bookings = pd.read_csv('cleaned datasets/fact_bookings.csv')
-df_dates = pd.read_csv('cleaned datasets/dim_date.csv')
-df_hotels = pd.read_csv('cleaned datasets/dim_hotels.csv')
-df_rooms = pd.read_csv('cleaned datasets/dim_room.csv')
-df_aggregated_bookings = pd.read_csv('cleaned datasets/fact_aggregated_bookings.csv')
-merged_bookings = pd.read_csv('cleaned datasets/merged_bookings_data.csv')
+from hotel_backend import get_backend
+from hotel_kpi import compute_kpis
+from hotel_memo import PrecomputedResults, ResultCache, precomputed_path
+from hotel_store import FRAMES, HotelDataStore
+from hotel_timing import in_context, stage, timed
+
+# Cleaned data, each table is loaded (and the facts merged) only when first used.
+# HOTEL_CHUNKSIZE=<rows> streams the cubes from the fact files instead, for histories larger than memory,
+# and HOTEL_WORKERS=<processes> rolls them up in a process pool.
+store = HotelDataStore(
+    chunksize=int(os.environ.get('HOTEL_CHUNKSIZE', 0)) or None,
+    workers=int(os.environ.get('HOTEL_WORKERS', 0)) or None,
+)
+
+# Metrics, tables and figures already computed for a filter selection of the current data
+results = ResultCache(maxsize=1024)
+
+# Metric cards and property tables of every filter selection, when hotel_precompute ran on the current data
+precomputed = PrecomputedResults(precomputed_path(store.data_dir))
+
+
+# Module level access to the tables (hotel_analysis.df_hotels) goes through the store
+def __getattr__(name):
+    if name in FRAMES:
+        return store.get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# A sidebar filter selection ('All' for no filter) and the filtered cubes it needs, filtered on first use.
+# dates=(start, end) narrows it to a date range, given as ISO strings (None keeps every day).
+# The cubes are filtered by a backend of the store (see hotel_backend).
+class Selection:
+    def __init__(self, month='All', room_type='All', city='All', hotel='All', data_store=None, dates=None,
+                 backend=None):
+        self.filters = (month, room_type, city, hotel)
+        self.dates = tuple(dates) if dates else None
+        self.key = self.filters + ((self.dates,) if self.dates else ())
+        self.store = data_store or store
+        self.backend = get_backend(self.store, backend) if backend else get_backend(self.store)
+
+    def _filtered(self, cube, month, room_type, city, hotel):
+        with stage(f'filter:{cube}') as timer:
+            rows = self.backend.filter(cube, dates=self.dates, room_class=room_type, property_name=hotel,
+                                       city=city, mmm_yy=month)
+            timer.count(len(rows))
+        return rows
+
+    @cached_property
+    def bookings(self):
+        return self._filtered('booking_cube', *self.filters)
+
+    @cached_property
+    def agg_bookings(self):
+        return self._filtered('capacity_cube', *self.filters)
+
+    # The property table and revenue split keep every hotel
+    @cached_property
+    def property_bookings(self):
+        month, room_type, city, _ = self.filters
+        return self._filtered('booking_cube', month, room_type, city, 'All')
+
+    # The city chart keeps every city
+    @cached_property
+    def city_bookings(self):
+        month, room_type, _, hotel = self.filters
+        return self._filtered('booking_cube', month, room_type, 'All', hotel)
+
+    # Totals of the date range and of the period of the same length before it, from the prefix sums. With a month
+    # both are kept inside it, like the cards; None when the range and the month don't overlap.
+    def period_comparison(self):
+        month, room_type, city, hotel = self.filters
+        start, end = _selection_days(self)
+        if pd.Timestamp(start) > pd.Timestamp(end):
+            return None
+        within = None if month == 'All' else _month_days(self.store, month)
+        return self.store.prefix_sums.compare(start, end, within=within, room_class=room_type, city=city, hotel=hotel)
+
+
+# Return a result for the selection from the cache, or else from the precomputed results,
+# computing it only when neither has it (timed as result:<name>, the stages it computes only show up then)
+def cached(name, selection, compute):
+    version = selection.store.version
+    with stage(f'result:{name}'):
+        return results.get_or_compute(version, (name,) + selection.key,
+                                      lambda: precomputed.get_or_compute(version, name, selection.key, compute))
 
 # Format values for easier readability
 def format_number(value):
@@ -21,29 +105,19 @@ def format_number(value):
     else:
         return f"{value:.0f}"
 
-# Convert date in datetime format for easier manipulation
-df_dates['date'] = pd.to_datetime(df_dates['date'])
-
-# Merging bookings data
-df_merged_bookings = df_bookings.merge(df_rooms, left_on='room_category', right_on='room_id', how='left')
-df_merged_bookings = df_merged_bookings.merge(df_hotels, left_on='property_id', right_on='property_id', how='left')
-df_merged_bookings['check_in_date'] = pd.to_datetime(df_merged_bookings['check_in_date'], format='%d-%b-%y')
-df_merged_bookings = df_merged_bookings.merge(df_dates, left_on='check_in_date', right_on='date', how='left')
-
-# Merging aggregated bookings data
-df_merged_agg_bookings = df_aggregated_bookings.merge(df_rooms, left_on='room_category', right_on='room_id', how='left')
-df_merged_agg_bookings = df_merged_agg_bookings.merge(df_hotels, left_on='property_id', right_on='property_id', how='left')
-df_merged_agg_bookings['check_in_date'] = pd.to_datetime(df_merged_agg_bookings['check_in_date'], format='%d-%b-%y')
-df_merged_agg_bookings = df_merged_agg_bookings.merge(df_dates, left_on='check_in_date', right_on='date', how='left')
-
 
 # KPI Matrics
+# The functions below take rows of the rollup cubes (store.booking_cube / store.capacity_cube),
+# where every row carries summed measures, so they never scan individual bookings.
+
 # Calculate total revenue
+@timed
 def total_revenue(filtered_bookings):
     revenue = filtered_bookings['revenue_realized'].sum()
     return format_number(revenue)
 
 # Calculate occupancy percentage
+@timed
 def occupancy_percentage(filtered_agg_bookings):
     successful_bookings = float(filtered_agg_bookings.successful_bookings.sum())
     capacity = filtered_agg_bookings.capacity.sum()
@@ -51,6 +125,7 @@ def occupancy_percentage(filtered_agg_bookings):
     return f"{round(occ_per * 100, 1)}%"
 
 # Calculate RevPAR (Revenue per Available Room)
+@timed
 def revpar(filtered_bookings, filtered_agg_bookings):
     total_revenue = filtered_bookings['revenue_realized'].sum()
     total_capacity = filtered_agg_bookings['capacity'].sum()
@@ -59,144 +134,339 @@ def revpar(filtered_bookings, filtered_agg_bookings):
     return format_number(total_revenue / total_capacity)
 
 # Calculate ADR (Average Daily Rate)
+@timed
 def adr(filtered_bookings):
     revenue = filtered_bookings.revenue_realized.sum()
-    bookings = filtered_bookings.booking_id.count()
+    bookings = filtered_bookings.bookings.sum()
     result = revenue / bookings
     return format_number(result)
 
 # Calculate DSRN (Daily Sellable Room Nights)
+@timed
 def dsrn(bookings):
-    bookings['date'] = pd.to_datetime(bookings['date'])
     num_days = (bookings['date'].max() - bookings['date'].min()).days + 1
     return format_number(bookings.capacity.sum() / num_days)
 
 # Calculate total bookings
+@timed
 def total_bookings(filtered_bookings):
-    bookings = filtered_bookings.booking_id.count()
+    bookings = filtered_bookings.bookings.sum()
     return format_number(bookings)
 
+# Format the numeric KPIs from compute_kpis for the metric cards
+def format_kpis(kpis):
+    return {
+        'revenue': format_number(kpis.revenue),
+        'bookings': format_number(kpis.bookings),
+        'capacity': format_number(kpis.capacity),
+        'occupancy': f"{round(kpis.occupancy * 100, 1)}%",
+        'adr': format_number(kpis.adr),
+        'revpar': format_number(kpis.revpar),
+        'dsrn': format_number(kpis.dsrn),
+        'dbrn': format_number(kpis.dbrn),
+        'durn': format_number(kpis.durn),
+    }
+
+
+
+# Weekly totals of the base measures, one row per week (by its first day), computed once per filter selection.
+# booking_capacity is the room day capacity counted once per booking, capacity the one of the aggregated bookings.
+@timed
+def weekly_rollup(filtered_bookings, filtered_agg_bookings):
+    weekly = filtered_bookings.groupby('week_first_day')[['revenue_realized', 'bookings', 'capacity']].sum()
+    weekly = weekly.rename(columns={'capacity': 'booking_capacity'})
+    agg_weekly = filtered_agg_bookings.groupby('week_first_day')[['capacity', 'successful_bookings']].sum()
+    return weekly.join(agg_weekly, how='left').fillna(0)
+
+
+def _safe_ratio(numerator, denominator):
+    return (numerator / denominator.where(denominator != 0)).fillna(0)
+
+
+# Weekly metrics the week over week comparison understands, each one computed from the rollup columns
+WEEKLY_METRICS = {
+    'revenue': lambda weekly: weekly['revenue_realized'],
+    'bookings': lambda weekly: weekly['bookings'],
+    'revpar': lambda weekly: _safe_ratio(weekly['revenue_realized'], weekly['capacity']),
+    'adr': lambda weekly: _safe_ratio(weekly['revenue_realized'], weekly['bookings']),
+    # Sellable nights per booking, the number of days in the range cancels out week over week
+    'dsrn': lambda weekly: _safe_ratio(weekly['booking_capacity'], weekly['bookings']),
+}
+
+
+# Value of a metric in the latest week of the rollup and in the week before it (0 when missing)
+def week_over_week(weekly, metric):
+    if weekly.empty:
+        return 0, 0
+    values = WEEKLY_METRICS[metric](weekly)
+    selected_week = weekly.index.max()
+    return values.get(selected_week, 0), values.get(selected_week - pd.Timedelta(days=7), 0)
+
+
+# % change between two weekly values, None when there is nothing to compare with
+def wow_change(current, previous):
+    if previous == 0 or pd.isna(previous):
+        return None
+    return ((current / previous) - 1) * 100
 
 
 # Calculate the KPI labels for revenue
-def revenue_description(filtered_bookings):
-    filtered_bookings = filtered_bookings.copy()
-    filtered_bookings.loc[:, 'week_no'] = filtered_bookings['week_no'].astype(str)
-    selected_week = filtered_bookings['week_no'].str.extract(r'(\d+)').astype(int).max()[0]
-    rev_cw = filtered_bookings.loc[filtered_bookings['week_no'] == f'W {selected_week}', 'revenue_realized'].sum()
-    rev_pw = filtered_bookings.loc[filtered_bookings['week_no'] == f'W {selected_week - 1}', 'revenue_realized'].sum()
-    if rev_pw == 0 or pd.isna(rev_pw):
+@timed
+def revenue_description(weekly):
+    wow = wow_change(*week_over_week(weekly, 'revenue'))
+    if wow is None:
         return "Revenue vs Last Week: No data for previous week"
-    wow_change = ((rev_cw / rev_pw) - 1) * 100
-    if wow_change > 0:
-        return f"Revenue vs Last Week: ▲ +{wow_change:.1f}%"
+    if wow > 0:
+        return f"Revenue vs Last Week: ▲ +{wow:.1f}%"
     else:
-        return f"Revenue vs Last Week: ▼ {wow_change:.1f}%"
+        return f"Revenue vs Last Week: ▼ {wow:.1f}%"
 
 # Calculate RevPAR (Revenue per Available Room) comparison
-def revpar_description(filtered_bookings, filtered_agg_bookings):
-    filtered_bookings = filtered_bookings.copy()
-    filtered_agg_bookings = filtered_agg_bookings.copy()
-    filtered_bookings.loc[:, 'week_no'] = filtered_bookings['week_no'].astype(str)
-    filtered_agg_bookings.loc[:, 'week_no'] = filtered_agg_bookings['week_no'].astype(str)
-    selected_week = filtered_bookings['week_no'].str.extract(r'(\d+)').astype(int).max()[0]
-    rev_cw = filtered_bookings.loc[filtered_bookings['week_no'] == f'W {selected_week}', 'revenue_realized'].sum()
-    capacity_cw = filtered_agg_bookings.loc[filtered_agg_bookings['week_no'] == f'W {selected_week}', 'capacity'].sum()
-    revpar_cw = rev_cw / capacity_cw if capacity_cw != 0 else 0
-    selected_week_prev = selected_week - 1
-    rev_pw = filtered_bookings.loc[filtered_bookings['week_no'] == f'W {selected_week_prev}', 'revenue_realized'].sum()
-    capacity_pw = filtered_agg_bookings.loc[filtered_agg_bookings['week_no'] == f'W {selected_week_prev}', 'capacity'].sum()
-    revpar_pw = rev_pw / capacity_pw if capacity_pw != 0 else 0
-    if revpar_pw != 0:
-        wow_change = ((revpar_cw - revpar_pw) / revpar_pw) * 100
-    else:
-        wow_change = 0
-    if wow_change > 0:
-        return f"RevPAR vs Last Week: ▲  +{wow_change:.1f}%"
+@timed
+def revpar_description(weekly):
+    wow = wow_change(*week_over_week(weekly, 'revpar')) or 0
+    if wow > 0:
+        return f"RevPAR vs Last Week: ▲  +{wow:.1f}%"
     else:
-        return f"RevPAR vs Last Week: ▼ {wow_change:.1f}%"
+        return f"RevPAR vs Last Week: ▼ {wow:.1f}%"
 
-# Calculate average occupancy percentage
+# Calculate average occupancy percentage over calendar weeks (Monday to Sunday)
+@timed
 def occupancy_description(filtered_agg_bookings):
-    filtered_agg_bookings['check_in_date'] = pd.to_datetime(filtered_agg_bookings['check_in_date'], errors='coerce')
-    filtered_agg_bookings['week_period'] = filtered_agg_bookings['check_in_date'].dt.to_period('W-SUN')
-    successful_bookings = filtered_agg_bookings.groupby('week_period')['successful_bookings'].sum()
-    capacity = filtered_agg_bookings.groupby('week_period')['capacity'].sum()
-    occupancy_percentage = (successful_bookings / capacity) * 100
+    weekly = filtered_agg_bookings.groupby('week_start')[['successful_bookings', 'capacity']].sum()
+    occupancy_percentage = (weekly['successful_bookings'] / weekly['capacity']) * 100
     avg_occ = occupancy_percentage.mean()
     return f"Average Occupancy: {avg_occ: .1f}%"
 
 # Calculate the bookings description
-def bookings_description(filtered_bookings):
-    filtered_bookings = filtered_bookings.copy()
-    filtered_bookings.loc[:, 'week_no'] = filtered_bookings['week_no'].astype(str)
-    selected_week = filtered_bookings['week_no'].str.extract(r'(\d+)').astype(int).max()[0]
-    rev_cw = filtered_bookings.loc[filtered_bookings['week_no'] == f'W {selected_week}', 'booking_id'].count()
-    rev_pw = filtered_bookings.loc[filtered_bookings['week_no'] == f'W {selected_week - 1}', 'booking_id'].count()
-    if rev_pw == 0 or pd.isna(rev_pw):
+@timed
+def bookings_description(weekly):
+    wow = wow_change(*week_over_week(weekly, 'bookings'))
+    if wow is None:
         return "Total Bookings vs Last Week: No data for previous week"
-    wow_change = ((rev_cw / rev_pw) - 1) * 100
-    if wow_change > 0:
-        return f"Total Bookings vs Last Week: ▲ +{wow_change:.1f}%"
+    if wow > 0:
+        return f"Total Bookings vs Last Week: ▲ +{wow:.1f}%"
     else:
-        return f"Total Bookings vs Last Week: ▼ {wow_change:.1f}%"
+        return f"Total Bookings vs Last Week: ▼ {wow:.1f}%"
 
 
 # Calculate ADR percentage changes (Weekly comparison)
-def adr_description(filtered_bookings):
-    filtered_bookings = filtered_bookings.copy()
-    filtered_bookings['week_no'] = filtered_bookings['week_no'].astype(str)
-    selected_week = filtered_bookings['week_no'].str.extract(r'(\d+)').astype(int).max()[0]
-    rev_cw = filtered_bookings.loc[filtered_bookings['week_no'] == f'W {selected_week}', 'revenue_realized'].sum()
-    capacity_cw = filtered_bookings.loc[filtered_bookings['week_no'] == f'W {selected_week}', 'booking_id'].count()
-    revpar_cw = rev_cw / capacity_cw if capacity_cw != 0 else 0
-    selected_week_prev = selected_week - 1
-    rev_pw = filtered_bookings.loc[filtered_bookings['week_no'] == f'W {selected_week_prev}', 'revenue_realized'].sum()
-    capacity_pw = filtered_bookings.loc[filtered_bookings['week_no'] == f'W {selected_week_prev}', 'booking_id'].count()
-    revpar_pw = rev_pw / capacity_pw if capacity_pw != 0 else 0
-    if revpar_pw != 0:
-        wow_change = ((revpar_cw - revpar_pw) / revpar_pw) * 100
-    else:
-        wow_change = 0
-    if wow_change > 0:
-        return f"ADR vs Last Week: ▲  +{wow_change:.1f}%"
+@timed
+def adr_description(weekly):
+    wow = wow_change(*week_over_week(weekly, 'adr')) or 0
+    if wow > 0:
+        return f"ADR vs Last Week: ▲  +{wow:.1f}%"
     else:
-        return f"ADR vs Last Week: ▼  {wow_change:.1f}%"
+        return f"ADR vs Last Week: ▼  {wow:.1f}%"
 
 
 # Calculate DSRN percentage changes (Weekly comparison)
-def dsrn_description(bookings):
-    filtered_agg_bookings = bookings.copy()
-    filtered_agg_bookings['check_in_date'] = pd.to_datetime(filtered_agg_bookings['check_in_date'])
-    num_days = (filtered_agg_bookings['check_in_date'].max() - filtered_agg_bookings['check_in_date'].min()).days + 1
-    filtered_agg_bookings['week_no'] = filtered_agg_bookings['week_no'].astype(str)
-    selected_week = filtered_agg_bookings['week_no'].str.extract(r'(\d+)').astype(int).max()[0]
-    
-    rev_cw = filtered_agg_bookings.loc[filtered_agg_bookings['week_no'] == f'W {selected_week}', 'capacity'].sum()
-    capacity_cw = filtered_agg_bookings.loc[filtered_agg_bookings['week_no'] == f'W {selected_week}'].shape[0] * num_days
-    dsrn_cw = rev_cw / capacity_cw if capacity_cw != 0 else 0
-    
-    selected_week_prev = selected_week - 1
-    rev_pw = filtered_agg_bookings.loc[filtered_agg_bookings['week_no'] == f'W {selected_week_prev}', 'capacity'].sum()
-    capacity_pw = filtered_agg_bookings.loc[filtered_agg_bookings['week_no'] == f'W {selected_week_prev}'].shape[0] * num_days
-    dsrn_pw = rev_pw / capacity_pw if capacity_pw != 0 else 0
-    
-    if dsrn_pw != 0:
-        wow_change = ((dsrn_cw - dsrn_pw) / dsrn_pw) * 100
+@timed
+def dsrn_description(weekly):
+    wow = wow_change(*week_over_week(weekly, 'dsrn')) or 0
+    if wow > 0:
+        return f"DSRN vs Last Week: ▲  +{wow:.1f}%"
     else:
-        wow_change = 0
-    
-    if wow_change > 0:
-        return f"DSRN vs Last Week: ▲  +{wow_change:.1f}%"
+        return f"DSRN vs Last Week: ▼ {wow:.1f}%"
+
+
+
+# Week over week description of each metric card drawn from the weekly rollup (occupancy has its own)
+WEEKLY_DESCRIPTIONS = {
+    'revenue': revenue_description,
+    'revpar': revpar_description,
+    'bookings': bookings_description,
+    'adr': adr_description,
+    'dsrn': dsrn_description,
+}
+
+# Metric cards of each dashboard tab, in the order the tab shows them
+TAB_CARDS = {
+    'Performance View': ('revenue', 'occupancy', 'revpar'),
+    'Booking Insights': ('bookings', 'adr', 'dsrn'),
+}
+
+
+# Values and week over week descriptions of the metric cards (all of them by default)
+@timed
+def metric_cards(selection, cards=('revenue', 'occupancy', 'revpar', 'bookings', 'adr', 'dsrn')):
+    kpis = format_kpis(compute_kpis(selection.bookings, selection.agg_bookings))
+    weekly = None
+    if any(card in WEEKLY_DESCRIPTIONS for card in cards):
+        weekly = weekly_rollup(selection.bookings, selection.agg_bookings)
+    result = {}
+    for card in cards:
+        if card == 'occupancy':
+            result[card] = (kpis[card], occupancy_description(selection.agg_bookings))
+        else:
+            result[card] = (kpis[card], WEEKLY_DESCRIPTIONS[card](weekly))
+    return result
+
+
+# Metric cards of one dashboard tab, the other tab's KPIs and descriptions are not computed
+# (precomputed results hold every card, the tab's are picked from them)
+def tab_cards(tab, selection):
+    names = TAB_CARDS[tab]
+
+    def compute():
+        every_card = precomputed.get(selection.store.version, 'metric_cards', selection.key)
+        if every_card is not None:
+            return {name: every_card[name] for name in names}
+        return metric_cards(selection, names)
+    return cached(f'cards:{tab}', selection, compute)
+
+
+# Seconds preview mode waits for the exact metric cards before showing estimates instead
+PREVIEW_WAIT = 0.05
+
+# Threads the exact metric cards are computed on while their estimates are shown
+refine_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='refine')
+
+# Thread the preview sample of a store is drawn on, once preview mode asks for it
+sample_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='preview-sample')
+
+
+def _preview_card(estimate):
+    return format_number(estimate.value), f"Preview, ±{format_number(estimate.margin)} at 95%"
+
+
+# Metric cards of a tab estimated from the store's preview sample (see hotel_preview), each described by its
+# margin of error. Occupancy and the RevPAR capacity come exact from the small capacity cube,
+# DSRN has no estimate and waits for the exact cards.
+@timed
+def preview_cards(tab, selection):
+    month, room_type, city, hotel = selection.filters
+    estimates = selection.store.preview_sample.estimate(month, room_type, city, hotel, dates=selection.dates)
+    capacity = selection.agg_bookings['capacity'].sum()
+    cards = {
+        'revenue': _preview_card(estimates['revenue']),
+        'bookings': _preview_card(estimates['bookings']),
+        'adr': _preview_card(estimates['adr']),
+        'revpar': _preview_card(estimates['revenue'].scaled(1 / capacity)) if capacity else (format_number(0), ''),
+        'occupancy': (occupancy_percentage(selection.agg_bookings), 'Exact'),
+        'dsrn': ('…', 'Refining'),
+    }
+    return {name: cards[name] for name in TAB_CARDS[tab]}
+
+
+# Metric cards of a tab in preview mode: the exact cards when they are ready within wait seconds, otherwise
+# the preview estimates along with the future of the exact cards that replace them. Until the store's preview
+# sample is drawn (in the background, started by the first preview on the store) the exact cards are waited for.
+def preview_tab_cards(tab, selection, wait=PREVIEW_WAIT):
+    exact = refine_pool.submit(in_context(tab_cards), tab, selection)
+    store = selection.store
+    if not store.preview_ready():
+        sample_pool.submit(lambda: store.preview_sample)
+        return exact.result(), None
+    try:
+        return exact.result(timeout=wait), None
+    except TimeoutError:
+        return cached(f'preview:{tab}', selection, lambda: preview_cards(tab, selection)), exact
+
+
+# Columns of the property table, in display order
+PERFORMANCE_COLUMNS = ['Property Name', 'Revenue', 'Bookings', 'Capacity', 'Occupancy %', 'cancellation %',
+                       'Realization %', 'ADR', 'RevPAR', 'DSRN', 'DBRN', 'DURN', 'Average Rating']
+
+
+def _percent(value):
+    return f"{round(value * 100, 1)}%"
+
+
+# How each number of the property table is shown
+PERFORMANCE_FORMATS = {
+    'Revenue': format_number, 'Bookings': format_number, 'Capacity': format_number,
+    'Occupancy %': _percent, 'cancellation %': _percent, 'Realization %': _percent,
+    'ADR': format_number, 'RevPAR': format_number, 'DSRN': format_number, 'DBRN': format_number,
+    'DURN': format_number, 'Average Rating': lambda value: f"{round(value, 1)}",
+}
+
+# Rows of the property table shown per page
+PAGE_SIZE = 25
+
+
+def _per(numerator, denominator):
+    return np.divide(numerator, denominator, out=np.zeros(len(numerator)), where=denominator != 0)
+
+
+# Every column of the property table for each property, numeric, in one grouped pass: each measure is summed
+# per property (and per booking status where a rate needs it) with a bincount over the property codes
+@timed
+def property_metrics(bookings):
+    names = bookings['property_name']
+    if isinstance(names.dtype, pd.CategoricalDtype):
+        codes, labels = names.cat.codes.to_numpy(), names.cat.categories
     else:
-        return f"DSRN vs Last Week: ▼ {wow_change:.1f}%"
+        codes, labels = pd.factorize(names, sort=True)
+    known = codes >= 0
+    codes = codes[known]
+
+    def total(values, where=None):
+        values = np.asarray(values, dtype='float64')[known]
+        if where is not None:
+            values = values * np.asarray(where)[known]
+        return np.bincount(codes, weights=values, minlength=len(labels))
+
+    status = bookings['booking_status']
+    revenue = total(bookings['revenue_realized'])
+    booked = total(bookings['bookings'])
+    capacity = total(bookings['capacity'])
+    cancelled = total(bookings['bookings'], status == 'Cancelled')
+    no_show = total(bookings['bookings'], status == 'No Show')
+    checked_out = total(bookings['bookings'], status == 'Checked Out')
+    ratings = total(bookings['ratings_given'].fillna(0))
+    rated = total(bookings['rated_bookings'])
+
+    dates = bookings['date']
+    days = np.full(len(labels), (dates.max() - dates.min()).days + 1 if len(dates) else 0)
+    present = np.bincount(codes, minlength=len(labels)) > 0
+    metrics = pd.DataFrame({
+        'Property Name': labels,
+        'Revenue': revenue,
+        'Bookings': booked,
+        'Capacity': capacity,
+        'Occupancy %': _per(booked, capacity),
+        'cancellation %': _per(cancelled, booked),
+        'Realization %': 1 - _per(cancelled + no_show, booked),
+        'ADR': _per(revenue, booked),
+        'RevPAR': _per(revenue, capacity),
+        'DSRN': _per(capacity, days),
+        'DBRN': _per(booked, days),
+        'DURN': _per(checked_out, days),
+        'Average Rating': _per(ratings, rated),
+    })
+    return metrics[present].reset_index(drop=True)
+
+
+# Format rows of the property table for display
+def format_performance(metrics):
+    return pd.DataFrame(
+        {column: metrics[column].map(PERFORMANCE_FORMATS.get(column, str)) for column in PERFORMANCE_COLUMNS},
+        index=metrics.index,
+    )
+
+
+# One page of the property table sorted on a column: the numbers are sorted, only the page's rows are formatted
+@timed
+def performance_page(metrics, sort_by='Property Name', descending=False, page=1, page_size=PAGE_SIZE):
+    if sort_by != 'Property Name' or descending:
+        metrics = metrics.sort_values(sort_by, ascending=not descending, kind='stable', ignore_index=True)
+    first = (page - 1) * page_size
+    return format_performance(metrics.iloc[first:first + page_size])
+
+
+# Create a hotel performance table, every property formatted
+@timed
+def hotel_performance(merged_bookings):
+    return format_performance(property_metrics(merged_bookings))
 
 
 
 # Create the charts For the Visualization 
 # Revenue % Pie Chart
+@timed
 def revenue_pie_chart(merged_bookings):
-    pie_chart_data = merged_bookings.groupby('category')['revenue_realized'].sum().reset_index()
+    pie_chart_data = merged_bookings.groupby('category', observed=True)['revenue_realized'].sum().reset_index()
     total_revenue = pie_chart_data['revenue_realized'].sum()
     pie_chart_data['percentage'] = (pie_chart_data['revenue_realized'] / total_revenue) * 100
     labels = pie_chart_data['category']
@@ -237,18 +507,19 @@ def revenue_pie_chart(merged_bookings):
 
 
 # Create combo line or column chart realization% and adr by platform
+@timed
 def realization_per_adr(bookings):
-    result = bookings.groupby('booking_platform').agg(
+    result = bookings.groupby('booking_platform', observed=True).agg(
         Revenue=('revenue_realized', 'sum'),
-        Bookings=('booking_id', 'count'),
+        Bookings=('bookings', 'sum'),
     )
     
     result['ADR'] = result['Revenue'] / result['Bookings']
     
     canceled_or_no_show = bookings[bookings.booking_status.isin(['Cancelled', 'No Show'])]
-    canceled_or_no_show_count = canceled_or_no_show.groupby('booking_platform')['booking_id'].count()
+    canceled_or_no_show_count = canceled_or_no_show.groupby('booking_platform', observed=True)['bookings'].sum()
     
-    realization_percentage = 1 - (canceled_or_no_show_count / bookings.groupby('booking_platform')['booking_id'].count())
+    realization_percentage = 1 - (canceled_or_no_show_count / result['Bookings'])
     result['Realization %'] = realization_percentage.fillna(0) * 100
     result['ADR'] = result['ADR'].apply(lambda x: f"{round(x / 1000, 1)}K" if x >= 1000 else round(x, 1))
     
@@ -295,12 +566,14 @@ def realization_per_adr(bookings):
     return fig
 
 
-# Occupancy% by week no
+# Occupancy% by week no, weeks in calendar order ('W 9' before 'W 10')
+@timed
 def occ_line(bookings):
-    result = bookings.groupby('week_no').agg(
+    result = bookings.groupby('week_no', observed=True).agg(
         successful_bookings=('successful_bookings', 'sum'),
-        capacity=('capacity', 'sum')
-    )
+        capacity=('capacity', 'sum'),
+        first_day=('date', 'min'),
+    ).sort_values('first_day')
     
     result['Occupancy %'] = result['successful_bookings'] / result['capacity']
     
@@ -337,9 +610,10 @@ def occ_line(bookings):
 
 
 # Calculate booking percentage by platform
+@timed
 def booking_percentage_by_platform(bookings):
-    platform_counts = bookings['booking_platform'].value_counts()
-    total_bookings = bookings['booking_id'].count()
+    platform_counts = bookings.groupby('booking_platform', observed=True)['bookings'].sum().sort_values(ascending=False)
+    total_bookings = bookings['bookings'].sum()
     booking_percentage = (platform_counts / total_bookings) * 100
     booking_percentage = booking_percentage.round(2)
     booking_percentage = booking_percentage.apply(lambda x: f'{x}%')
@@ -378,10 +652,11 @@ def booking_percentage_by_platform(bookings):
 
 
 # ADR By category
+@timed
 def adr_pie_chart(bookings):
-    result = bookings.groupby('category').agg(
+    result = bookings.groupby('category', observed=True).agg(
         Revenue=('revenue_realized', 'sum'),
-        Bookings=('booking_id', 'count'),
+        Bookings=('bookings', 'sum'),
     )
     
     result['ADR'] = result['Revenue'] / result['Bookings']
@@ -427,8 +702,9 @@ def adr_pie_chart(bookings):
 
 
 # Calculate the funnel chart room class
+@timed
 def room_class_by_occ(bookings):
-    result = bookings.groupby('room_class').agg(
+    result = bookings.groupby('room_class', observed=True).agg(
         successful_bookings=('successful_bookings', 'sum'),
         capacity=('capacity', 'sum')
     )
@@ -464,9 +740,10 @@ def room_class_by_occ(bookings):
 
 
 #calculate the bar chart by booking%
+@timed
 def bar_city(city_bookings):
-    platform_counts = city_bookings['city'].value_counts()
-    total_bookings = city_bookings['booking_id'].count()
+    platform_counts = city_bookings.groupby('city', observed=True)['bookings'].sum().sort_values(ascending=False)
+    total_bookings = city_bookings['bookings'].sum()
     booking_percentage = (platform_counts / total_bookings) * 100
     booking_percentage = booking_percentage.round(1)
     booking_percentage = booking_percentage.apply(lambda x: f'{x}%')
@@ -506,3 +783,110 @@ def bar_city(city_bookings):
     
     return fig
 
+
+# Rolling windows the trend chart offers (days), and the most points a trend line is drawn with
+TREND_WINDOWS = (7, 14, 28)
+TREND_POINTS = 400
+
+
+# Average consecutive rows in equal buckets so a series has at most `points` rows, each bucket dated by its first day
+def downsample(series, points=TREND_POINTS):
+    if len(series) <= points:
+        return series
+    size = -(-len(series) // points)
+    buckets = np.arange(len(series)) // size
+    result = series.groupby(buckets).mean()
+    result.index = series.index[::size]
+    return result
+
+
+# First and last day of a month of the date dimension
+def _month_days(data_store, month):
+    days = data_store.df_dates.loc[data_store.df_dates['mmm_yy'] == month, 'date']
+    return days.min(), days.max()
+
+
+# First and last day of a selection: its month and its date range, whichever is narrower (None is open)
+def _selection_days(selection):
+    start, end = selection.dates or (None, None)
+    month = selection.filters[0]
+    if month != 'All':
+        first, last = _month_days(selection.store, month)
+        start = max(filter(None, [pd.Timestamp(start) if start else None, first]))
+        end = min(filter(None, [pd.Timestamp(end) if end else None, last]))
+    return start, end
+
+
+# Rolling occupancy and daily revenue over the selection's days, from the store's prefix sums:
+# each day's window is two lookups, so the chart costs O(days) whatever the number of bookings
+@timed
+def trend_chart(selection, window=7):
+    _, room_type, city, hotel = selection.filters
+    start, end = _selection_days(selection)
+    rolling = selection.store.prefix_sums.rolling(window, start, end, room_class=room_type, city=city, hotel=hotel)
+    trend = pd.DataFrame({
+        'occupancy': rolling['successful_bookings'] / rolling['capacity'].where(rolling['capacity'] > 0),
+        'revenue': rolling['revenue'] / rolling['days'].where(rolling['days'] > 0),
+    })
+    trend = downsample(trend)
+
+    fig = go.Figure([
+        go.Scatter(x=trend.index, y=trend['occupancy'], name=f'Occupancy % ({window}-day)', mode='lines',
+                   line=dict(color='#2b2b2b', width=2)),
+        go.Scatter(x=trend.index, y=trend['revenue'], name=f'Revenue per day ({window}-day)', mode='lines',
+                   line=dict(color='#a2a2a2', width=2), yaxis='y2'),
+    ])
+    fig.update_layout(
+        title=dict(text='Rolling Occupancy % & Revenue', x=0.05, xanchor='left', font=dict(size=13, family='Arial', weight='normal')),
+        legend=dict(orientation='h', x=0.5, xanchor='center', y=1.0, yanchor='bottom'),
+        xaxis=dict(showgrid=False),
+        yaxis=dict(showgrid=False, tickformat='.1%', tickfont=dict(size=10)),
+        yaxis2=dict(showgrid=False, overlaying='y', side='right', tickfont=dict(size=10)),
+    )
+    return fig
+
+
+# Trend chart for the selection and window, cached as plotly JSON like the other figures
+def trend_figure(selection, window=7):
+    figure = cached(f'trend:{window}', selection, lambda: trend_chart(selection, window).to_json())
+    return json.loads(figure)
+
+
+# Chart builders and the filtered cube of a Selection each one is drawn from
+CHARTS = {
+    'revenue_pie_chart': (revenue_pie_chart, 'property_bookings'),
+    'realization_per_adr': (realization_per_adr, 'bookings'),
+    'occ_line': (occ_line, 'bookings'),
+    'booking_percentage_by_platform': (booking_percentage_by_platform, 'bookings'),
+    'adr_pie_chart': (adr_pie_chart, 'bookings'),
+    'room_class_by_occ': (room_class_by_occ, 'bookings'),
+    'bar_city': (bar_city, 'city_bookings'),
+}
+
+
+# Chart figure for the selection, cached as plotly JSON and handed out as a fresh dict
+def cached_figure(name, selection):
+    build, frame = CHARTS[name]
+    figure = cached(name, selection, lambda: build(getattr(selection, frame)).to_json())
+    return json.loads(figure)
+
+
+# Charts of each dashboard tab, in the order the tab lays them out
+TAB_CHARTS = {
+    'Performance View': ('revenue_pie_chart', 'realization_per_adr'),
+    'Booking Insights': ('occ_line', 'booking_percentage_by_platform', 'adr_pie_chart', 'room_class_by_occ', 'bar_city'),
+}
+
+# Threads the figures of a tab are built on
+figure_pool = ThreadPoolExecutor(max_workers=max(len(names) for names in TAB_CHARTS.values()),
+                                 thread_name_prefix='figures')
+
+
+# Start building every figure of a tab at once and return them lazily in layout order,
+# so the first chart can be drawn while the others are still being built
+def tab_figures(tab, selection):
+    names = TAB_CHARTS[tab]
+    # The filtered cubes are cached on the selection, filter them here once rather than racing in the threads
+    for frame in dict.fromkeys(CHARTS[name][1] for name in names):
+        getattr(selection, frame)
+    return figure_pool.map(in_context(lambda name: cached_figure(name, selection)), names)
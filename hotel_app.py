@@ -1,11 +1,20 @@
 import streamlit as st
 import hotel_analysis  
+import hotel_refresh
+import hotel_timing
 import streamlit_shadcn_ui as ui
 import pandas as pd
 
 # Set page config for the app (title, icon, and layout)
 st.set_page_config(page_title='Atliq Hospitality', page_icon="📊", layout="wide")
 
+# Time the stages of this rerun when the performance panel is open
+hotel_timing.start(st.session_state.get('show_timings', False))
+
+# Pick up new data in the background, and read this whole rerun from the store serving when it started
+hotel_refresh.start()
+data_store = hotel_analysis.store
+
 hide_menu_style = """
     <style>
     #MainMenu {visibility: hidden;}
@@ -26,10 +35,18 @@ st.markdown("""
 
 # Sidebar filters for user input
 st.sidebar.header("Filters")
-selected_month = st.sidebar.radio('Select Month', ['All'] + list(hotel_analysis.df_dates['mmm_yy'].dropna().unique()), index=0)
-selected_room_type = st.sidebar.selectbox('Select Room Type', ['All'] + list(hotel_analysis.df_rooms['room_class'].unique()), index=0)
-selected_city = st.sidebar.selectbox('Select City', ['All'] + list(hotel_analysis.df_hotels['city'].unique()), index=0)
-selected_hotel = st.sidebar.selectbox('Select Hotel', ['All'] + list(hotel_analysis.df_hotels['property_name'].unique()), index=0)
+selected_month = st.sidebar.radio('Select Month', ['All'] + list(data_store.df_dates['mmm_yy'].dropna().unique()), index=0)
+selected_room_type = st.sidebar.selectbox('Select Room Type', ['All'] + list(data_store.df_rooms['room_class'].unique()), index=0)
+selected_city = st.sidebar.selectbox('Select City', ['All'] + list(data_store.df_hotels['city'].unique()), index=0)
+selected_hotel = st.sidebar.selectbox('Select Hotel', ['All'] + list(data_store.df_hotels['property_name'].unique()), index=0)
+all_dates = data_store.df_dates['date'].dropna()
+first_day, last_day = all_dates.min().date(), all_dates.max().date()
+selected_dates = st.sidebar.date_input('Select Date Range', value=(first_day, last_day), min_value=first_day, max_value=last_day)
+
+# The full range (or a range still being picked) is no date filter
+date_range = None
+if len(selected_dates) == 2 and tuple(selected_dates) != (first_day, last_day):
+    date_range = tuple(day.isoformat() for day in selected_dates)
 
 
 # Additional sidebar information
@@ -38,6 +55,9 @@ st.sidebar.caption('DSRN -> Daily Sellable Room Nights')
 st.sidebar.caption('ADR -> Average Daily Rate')
 st.sidebar.caption('DURN -> Daily Utilized Room Nights')
 st.sidebar.caption('DBRN -> Daily Booking Rate Per Night')
+preview = st.sidebar.checkbox('Fast preview', value=False, key='preview',
+                              help='Show estimated metric cards while the exact ones are computed')
+show_timings = st.sidebar.checkbox('Show performance panel', value=False, key='show_timings')
 
 
 # LinkedIn avatar in the bottom-right corner (Link to profile)
@@ -55,108 +75,49 @@ selected_tab = ui.tabs(
     default_value='Performance View', 
 )
 
-# Apply filters to the data (based on the selected sidebar options)
-filtered_bookings = hotel_analysis.df_merged_bookings.copy()
-filtered_agg_bookings = hotel_analysis.df_merged_agg_bookings.copy()
-merged_bookings = hotel_analysis.merged_bookings.copy()
-bookings = hotel_analysis.merged_bookings.copy()
-city_bookings = hotel_analysis.merged_bookings.copy()
-
-# Filter by Room Type if selected
-if selected_room_type != 'All':
-    filtered_bookings = filtered_bookings[filtered_bookings['room_class'] == selected_room_type]
-    filtered_agg_bookings = filtered_agg_bookings[filtered_agg_bookings['room_class'] == selected_room_type]
-    merged_bookings = merged_bookings[merged_bookings['room_class'] == selected_room_type]
-    bookings = bookings[bookings['room_class'] == selected_room_type]
-    city_bookings = city_bookings[city_bookings['room_class'] == selected_room_type]
-
-# Filter by Hotel if selected
-if selected_hotel != 'All':
-    filtered_bookings = filtered_bookings[filtered_bookings['property_name'] == selected_hotel]
-    filtered_agg_bookings = filtered_agg_bookings[filtered_agg_bookings['property_name'] == selected_hotel]
-    bookings = bookings[bookings['property_name'] == selected_hotel]
-    city_bookings = city_bookings[city_bookings['property_name'] == selected_hotel]
-    
-# Filter by City if selected
-if selected_city != 'All':
-    filtered_bookings = filtered_bookings[filtered_bookings['city'] == selected_city]
-    filtered_agg_bookings = filtered_agg_bookings[filtered_agg_bookings['city'] == selected_city]
-    merged_bookings = merged_bookings[merged_bookings['city'] == selected_city]
-    bookings = bookings[bookings['city'] == selected_city]
-
-# Filter by Month if selected
-if selected_month != 'All':
-    filtered_bookings = filtered_bookings[filtered_bookings['mmm_yy'] == selected_month]
-    filtered_agg_bookings = filtered_agg_bookings[filtered_agg_bookings['mmm_yy'] == selected_month]
-    merged_bookings = merged_bookings[merged_bookings['mmm_yy'] == selected_month]
-    bookings = bookings[bookings['mmm_yy'] == selected_month]
-    city_bookings = city_bookings[city_bookings['mmm_yy'] == selected_month]
-
-
-
-# Performance View Tab page
-# Calculate the filtered Metrics (revenue, occupancy percentage, RevPAR) 
-revenue = hotel_analysis.total_revenue(filtered_bookings)
-occupancy_per = hotel_analysis.occupancy_percentage(filtered_agg_bookings) 
-revpar_value = hotel_analysis.revpar(filtered_bookings, filtered_agg_bookings)
-revenue_description = hotel_analysis.revenue_description(filtered_bookings)
-occupancy_description = hotel_analysis.occupancy_description(filtered_agg_bookings)
-revpar_description = hotel_analysis.revpar_description(filtered_bookings, filtered_agg_bookings)
-total_bookings = hotel_analysis.total_bookings(filtered_bookings)
-bookings_description = hotel_analysis.bookings_description(filtered_bookings)
-adr_value = hotel_analysis.adr(filtered_bookings)
-adr_description = hotel_analysis.adr_description(filtered_bookings)
-dsrn_value = hotel_analysis.dsrn(bookings)
-dsrn_description = hotel_analysis.dsrn_description(bookings)
-
-# Create a hotel performance table 
-hotel_performance = merged_bookings.groupby('property_name').agg(
-    Revenue=('revenue_realized', 'sum'),
-    Bookings=('booking_id', 'count'),
-    Capacity=('capacity', 'sum')
-).reset_index()
-
-# Convert check-in date to datetime and calculate the date range
-merged_bookings['check_in_date'] = pd.to_datetime(merged_bookings['check_in_date'])
-date_range = (merged_bookings['check_in_date'].max() - merged_bookings['check_in_date'].min()).days + 1
-
-hotel_performance['Occupancy %'] = hotel_performance['Bookings'] / hotel_performance['Capacity']
-hotel_performance['cancellation %'] = merged_bookings[merged_bookings.booking_status == 'Cancelled'].shape[0] / merged_bookings.booking_id.count()
-hotel_performance['Realization %'] = (1 - ((merged_bookings[merged_bookings.booking_status == 'Cancelled'].shape[0] + 
-                                              merged_bookings[merged_bookings.booking_status == 'No Show'].shape[0]) / merged_bookings.shape[0]))
-hotel_performance['ADR'] = hotel_performance['Revenue'] / hotel_performance['Bookings']
-hotel_performance['RevPAR'] = hotel_performance['Revenue'] / hotel_performance['Capacity'] 
-hotel_performance['DSRN'] = hotel_performance['Capacity'] / date_range
-hotel_performance['DBRN'] = hotel_performance['Bookings'] / date_range
-hotel_performance['DURN'] = merged_bookings[merged_bookings.booking_status == 'Checked Out'].shape[0] / date_range
-hotel_performance['Average Rating'] = merged_bookings['ratings_given'].mean()
-
-hotel_performance['Revenue'] = hotel_performance['Revenue'].apply(hotel_analysis.format_number)
-hotel_performance['Bookings'] = hotel_performance['Bookings'].apply(hotel_analysis.format_number)
-hotel_performance['Capacity'] = hotel_performance['Capacity'].apply(hotel_analysis.format_number)
-hotel_performance['Occupancy %'] = hotel_performance['Occupancy %'].apply(lambda x: f"{round(x * 100, 1)}%")
-hotel_performance['cancellation %'] = hotel_performance['cancellation %'].apply(lambda x: f"{round(x * 100, 1)}%")
-hotel_performance['Realization %'] = hotel_performance['Realization %'].apply(lambda x: f"{round(x * 100, 1)}%")
-hotel_performance['ADR'] = hotel_performance['ADR'].apply(hotel_analysis.format_number)
-hotel_performance['RevPAR'] = hotel_performance['RevPAR'].apply(hotel_analysis.format_number)
-hotel_performance['DSRN'] = hotel_performance['DSRN'].apply(hotel_analysis.format_number)
-hotel_performance['DBRN'] = hotel_performance['DBRN'].apply(hotel_analysis.format_number)
-hotel_performance['DURN'] = hotel_performance['DURN'].apply(hotel_analysis.format_number)
-hotel_performance['Average Rating'] = hotel_performance['Average Rating'].apply(lambda x: f"{round(x, 1)}")
-
-hotel_performance.rename(columns={'property_name': 'Property Name'}, inplace=True)
-hotel_performance = hotel_performance[['Property Name', 'Revenue', 'Bookings', 'Capacity', 'Occupancy %', 'cancellation %', 'Realization %', 
-                                       'ADR', 'RevPAR', 'DSRN', 'DBRN', 'DURN', 'Average Rating']]
+# Filter selection of this rerun, the cubes are only filtered for results that are not cached yet
+selection = hotel_analysis.Selection(selected_month, selected_room_type, selected_city, selected_hotel,
+                                     data_store=data_store, dates=date_range)
+
+# Revenue of a custom date range (within the month) against the period of the same length before it
+comparison = selection.period_comparison() if date_range else None
+if comparison is not None:
+    current, previous = comparison
+    caption = f"Revenue {hotel_analysis.format_number(current['revenue'])}"
+    if previous['days'] == current['days'] and previous['revenue']:
+        change = (current['revenue'] - previous['revenue']) / previous['revenue'] * 100
+        caption += f" ({change:+.1f}% vs the previous {current['days']} days)"
+    st.sidebar.caption(caption)
+
+# Only the selected tab is computed: its figures are built on a thread pool while its metric cards
+# (value and week over week description) and table are computed here, then drawn in layout order
+figures = hotel_analysis.tab_figures(selected_tab, selection)
+if preview:
+    cards, exact_cards = hotel_analysis.preview_tab_cards(selected_tab, selection)
+else:
+    cards, exact_cards = hotel_analysis.tab_cards(selected_tab, selection), None
+
+CARD_TITLES = {
+    'revenue': 'Total Revenue', 'occupancy': 'Occupancy %', 'revpar': 'RevPAR',
+    'bookings': 'Total Bookings', 'adr': 'ADR', 'dsrn': 'DSRN',
+}
+
+
+# Draw the tab's metric cards into their slots, preview estimates under keys of their own
+def show_cards(slots, cards, key_suffix=''):
+    for position, (slot, name) in enumerate(zip(slots, hotel_analysis.TAB_CARDS[selected_tab]), start=1):
+        value, description = cards[name]
+        with slot.container():
+            ui.metric_card(title=CARD_TITLES[name], content=value, description=description,
+                           key=f"card{position}{key_suffix}")
+
 
 # Display content based on the selected tab
 if selected_tab == 'Performance View':
-    cols = st.columns(3)
-    with cols[0]:
-        ui.metric_card(title="Total Revenue", content=revenue, description=revenue_description, key="card1")
-    with cols[1]:
-        ui.metric_card(title="Occupancy %", content=occupancy_per, description=occupancy_description, key="card2")
-    with cols[2]:
-        ui.metric_card(title="RevPAR", content=revpar_value, description=revpar_description, key="card3")
+    card_slots = [col.empty() for col in st.columns(3)]
+    show_cards(card_slots, cards, '_preview' if exact_cards else '')
+    property_metrics = hotel_analysis.cached('property_metrics', selection,
+                                             lambda: hotel_analysis.property_metrics(selection.property_bookings))
     
     columns_table = st.columns(1)
     with columns_table[0]:
@@ -165,41 +126,59 @@ if selected_tab == 'Performance View':
          <h5 style="font-size: 15px; margin-bottom: -10px; text-align: center;">Insights By Property</h5>
           </div>
         """, unsafe_allow_html=True)
-        st.dataframe(hotel_performance)
+        # Sorted on the numbers, only the rows of the page shown are formatted
+        pages = max(1, -(-len(property_metrics) // hotel_analysis.PAGE_SIZE))
+        if st.session_state.get('performance_page', 1) > pages:
+            st.session_state['performance_page'] = pages
+        sort_col, order_col, page_col = st.columns([2, 1, 1])
+        sort_by = sort_col.selectbox('Sort by', hotel_analysis.PERFORMANCE_COLUMNS, index=0, key='performance_sort')
+        descending = order_col.toggle('Descending', value=False, key='performance_descending')
+        page = page_col.number_input(f'Page (of {pages})', min_value=1, max_value=pages, value=1, step=1,
+                                     key='performance_page')
+        st.dataframe(hotel_analysis.performance_page(property_metrics, sort_by, descending, page))
     
     col1, col2 = st.columns(2)
     with col1:
-        fig = hotel_analysis.revenue_pie_chart(merged_bookings)
+        fig = next(figures)
         st.plotly_chart(fig)
     with col2:
-        fig = hotel_analysis.realization_per_adr(bookings)
+        fig = next(figures)
         st.plotly_chart(fig)
 
 elif selected_tab == 'Booking Insights':
-    cols = st.columns(3)
-    with cols[0]:
-        ui.metric_card(title="Total Bookings", content=total_bookings, description=bookings_description, key="card1")
-    with cols[1]:
-        ui.metric_card(title="ADR", content=adr_value, description=adr_description, key="card2")
-    with cols[2]:
-        ui.metric_card(title="DSRN", content=dsrn_value, description=dsrn_description, key="card3")
+    card_slots = [col.empty() for col in st.columns(3)]
+    show_cards(card_slots, cards, '_preview' if exact_cards else '')
 
     col = st.columns(2)
     with col[0]:
-        fig = hotel_analysis.occ_line(bookings)
+        fig = next(figures)
         st.plotly_chart(fig) 
     with col[1]:
-        fig = hotel_analysis.booking_percentage_by_platform(bookings)
+        fig = next(figures)
         st.plotly_chart(fig)
         
     colum = st.columns(3)
     with colum[0]:
-        fig = hotel_analysis.adr_pie_chart(bookings)
+        fig = next(figures)
         st.plotly_chart(fig)
     with colum[1]:
-        fig = hotel_analysis.room_class_by_occ(bookings)
+        fig = next(figures)
         st.plotly_chart(fig)
     with colum[2]:
-        fig = hotel_analysis.bar_city(city_bookings)
+        fig = next(figures)
         st.plotly_chart(fig)
+
+    window = st.radio('Rolling window (days)', hotel_analysis.TREND_WINDOWS, index=0, horizontal=True, key='trend_window')
+    st.plotly_chart(hotel_analysis.trend_figure(selection, window))
+
+# Preview estimates are replaced by the exact cards once they are computed
+if exact_cards is not None:
+    show_cards(card_slots, exact_cards.result())
+
+# Performance panel: duration and rows of every stage of this rerun, nested stages indented
+if show_timings:
+    timings = pd.DataFrame(hotel_timing.collect(), columns=['stage', 'ms', 'rows', 'depth'])
+    timings['stage'] = ['\u2003' * depth + name for name, depth in zip(timings['stage'], timings['depth'])]
+    timings['rows'] = timings['rows'].astype('Int64')
+    st.sidebar.dataframe(timings[['stage', 'ms', 'rows']], hide_index=True)
     
\ No newline at end of file
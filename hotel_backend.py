@@ -0,0 +1,32 @@
+import threading
+
+# Backend of the dashboard when none is given
+DEFAULT_BACKEND = 'pandas'
+
+
+# The one operation hotel_analysis asks of a backend: the rows of a table of the store (a cube or a raw frame)
+# matching the sidebar filters, column=value ('All' for no filter), and dates=(start, end) an inclusive date range.
+# The KPI and chart functions then group and sum those rows in pandas, whichever backend filtered them.
+class PandasBackend:
+    name = 'pandas'
+
+    def __init__(self, data_store):
+        self.store = data_store
+
+    def filter(self, table, dates=None, **filters):
+        return self.store.filtered(table, dates=dates, **filters)
+
+
+BACKENDS = {'pandas': PandasBackend}
+
+_backends_lock = threading.Lock()
+
+
+# The backend called name for a store, created on first use. It is kept on the store (one per store and name,
+# shared by every selection) and goes away with it.
+def get_backend(data_store, name=DEFAULT_BACKEND):
+    with _backends_lock:
+        backends = data_store._backends
+        if name not in backends:
+            backends[name] = BACKENDS[name](data_store)
+        return backends[name]
@@ -0,0 +1,237 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import hotel_analysis
+from hotel_kpi import compute_kpis
+from hotel_store import HotelDataStore
+from hotel_synth import generate
+
+# Generated datasets are kept here between runs, one folder per scale
+BENCH_DIR = '.bench'
+
+# Every run appends its timings to this file, one json object per line
+RESULTS_FILE = 'bench_results.jsonl'
+
+# Scales measured by default: (bookings, properties, days)
+SCALES = [(1_000_000, 100, 365), (5_000_000, 200, 730)]
+
+# A change is reported as a regression when it is this much slower than the baseline run,
+# and by more than MIN_DELTA seconds so the noise of sub-millisecond calls is not reported
+THRESHOLD = 1.2
+MIN_DELTA = 0.001
+
+
+# Folder with the datasets of a scale, generated the first time it is asked for
+def dataset(bookings, properties, days):
+    path = os.path.join(BENCH_DIR, f'{bookings}_{properties}_{days}')
+    if not os.path.exists(path):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        generate(tmp_path, bookings, properties, days)
+        os.replace(tmp_path, path)
+    return path
+
+
+# Filter selections of the sidebar to time: nothing selected, one month and city, and everything selected
+def selections(store):
+    month = store.df_dates['mmm_yy'].iloc[0]
+    city = store.df_hotels['city'].iloc[0]
+    hotel = store.df_hotels['property_name'].iloc[0]
+    room = store.df_rooms['room_class'].iloc[0]
+    return {
+        'all': ('All', 'All', 'All', 'All'),
+        'month_city': (month, 'All', city, 'All'),
+        'narrow': (month, room, city, hotel),
+    }
+
+
+# Every KPI, description, table and chart function of hotel_analysis, called on the cubes of a selection
+def tasks(selection):
+    bookings, agg_bookings = selection.bookings, selection.agg_bookings
+    weekly = hotel_analysis.weekly_rollup(bookings, agg_bookings)
+    suite = {
+        'total_revenue': lambda: hotel_analysis.total_revenue(bookings),
+        'occupancy_percentage': lambda: hotel_analysis.occupancy_percentage(agg_bookings),
+        'revpar': lambda: hotel_analysis.revpar(bookings, agg_bookings),
+        'adr': lambda: hotel_analysis.adr(bookings),
+        'dsrn': lambda: hotel_analysis.dsrn(bookings),
+        'total_bookings': lambda: hotel_analysis.total_bookings(bookings),
+        'compute_kpis': lambda: compute_kpis(bookings, agg_bookings),
+        'weekly_rollup': lambda: hotel_analysis.weekly_rollup(bookings, agg_bookings),
+        'revenue_description': lambda: hotel_analysis.revenue_description(weekly),
+        'revpar_description': lambda: hotel_analysis.revpar_description(weekly),
+        'occupancy_description': lambda: hotel_analysis.occupancy_description(agg_bookings),
+        'bookings_description': lambda: hotel_analysis.bookings_description(weekly),
+        'adr_description': lambda: hotel_analysis.adr_description(weekly),
+        'dsrn_description': lambda: hotel_analysis.dsrn_description(weekly),
+        'hotel_performance': lambda: hotel_analysis.hotel_performance(selection.property_bookings),
+        'property_metrics': lambda: hotel_analysis.property_metrics(selection.property_bookings),
+        'performance_page': lambda: hotel_analysis.performance_page(
+            hotel_analysis.property_metrics(selection.property_bookings), 'Revenue', descending=True),
+    }
+    for window in hotel_analysis.TREND_WINDOWS:
+        suite[f'trend_chart:{window}'] = lambda window=window: hotel_analysis.trend_chart(selection, window)
+    for name, (build, attribute) in hotel_analysis.CHARTS.items():
+        suite[name] = lambda build=build, attribute=attribute: build(getattr(selection, attribute))
+    return suite
+
+
+# What hotel_app computes on a rerun of a tab: the filtered cubes, the tab's metric cards and charts,
+# and the first page of the property table on the performance tab. cold drops the cached results first, so everything is computed again.
+def app_rerun(store, filters, tab, cold=True):
+    if cold:
+        hotel_analysis.results.clear()
+    selection = hotel_analysis.Selection(*filters, data_store=store)
+    figures = hotel_analysis.tab_figures(tab, selection)
+    hotel_analysis.tab_cards(tab, selection)
+    if tab == 'Performance View':
+        metrics = hotel_analysis.cached('property_metrics', selection,
+                                        lambda: hotel_analysis.property_metrics(selection.property_bookings))
+        hotel_analysis.performance_page(metrics)
+    list(figures)
+
+
+# Loading what the dashboard needs: the dimensions and both cubes
+def load(path, **options):
+    store = HotelDataStore(path, **options)
+    store.warm(['df_dates', 'df_hotels', 'df_rooms', 'capacity_cube', 'booking_cube'])
+    return store
+
+
+def _timings(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def _commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Store options of a run as recorded with its timings, options left at their default are not listed
+def _options(options):
+    return {name: value for name, value in sorted(options.items()) if value is not None}
+
+
+# Time the whole suite at every scale and append the results to the results file, each timing with the
+# store options (chunksize, workers) it was measured with
+def run(scales=SCALES, repeat=5, results_file=RESULTS_FILE, **options):
+    run_id = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    commit = _commit()
+    recorded_options = _options(options)
+    records = []
+
+    def record(scale, selection, task, times):
+        records.append({
+            'run': run_id,
+            'commit': commit,
+            'options': recorded_options,
+            'scale': scale,
+            'selection': selection,
+            'task': task,
+            'best': min(times),
+            'median': statistics.median(times),
+            'repeat': len(times),
+        })
+        print(f'{scale:>24} {selection:>10} {task:>32} {min(times) * 1000:10.2f} ms')
+
+    for bookings, properties, days in scales:
+        path = dataset(bookings, properties, days)
+        scale = f'{bookings}x{properties}x{days}'
+        # The first load converts the csv files, the later ones read the columnar cache
+        shutil.rmtree(os.path.join(path, '.cache'), ignore_errors=True)
+        record(scale, '-', 'load_csv', _timings(lambda: load(path, **options), 1))
+        record(scale, '-', 'load_cached', _timings(lambda: load(path, **options), repeat))
+        store = load(path, **options)
+
+        for name, filters in selections(store).items():
+            for tab in hotel_analysis.TAB_CHARTS:
+                task = tab.lower().replace(' ', '_')
+                record(scale, name, f'app_rerun_cold:{task}', _timings(lambda: app_rerun(store, filters, tab), repeat))
+                record(scale, name, f'app_rerun_cached:{task}',
+                       _timings(lambda: app_rerun(store, filters, tab, cold=False), repeat))
+            selection = hotel_analysis.Selection(*filters, data_store=store)
+            for task, fn in tasks(selection).items():
+                record(scale, name, task, _timings(fn, repeat))
+
+    with open(results_file, 'a') as f:
+        for result in records:
+            f.write(json.dumps(result) + '\n')
+    return run_id
+
+
+# Compare two runs (the last two by default), returning the timings that got slower than the threshold.
+# Runs made with different store options time different code paths and are not compared.
+def compare(results_file=RESULTS_FILE, baseline=None, current=None, threshold=THRESHOLD):
+    with open(results_file) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    runs = list(dict.fromkeys(result['run'] for result in records))
+    if current is None:
+        current = runs[-1]
+    if baseline is None:
+        baseline = runs[runs.index(current) - 1] if runs.index(current) else current
+
+    def timings(run_id):
+        return {(r['scale'], r['selection'], r['task']): r['best'] for r in records if r['run'] == run_id}
+
+    def run_options(run_id):
+        return next(_options(r.get('options', {})) for r in records if r['run'] == run_id)
+
+    if run_options(baseline) != run_options(current):
+        raise ValueError(f'Runs {baseline} ({run_options(baseline) or "default options"}) and {current} '
+                         f'({run_options(current) or "default options"}) were made with different options')
+
+    before, after = timings(baseline), timings(current)
+    regressions = []
+    print(f'{baseline} -> {current}')
+    for key in sorted(before.keys() & after.keys()):
+        ratio = after[key] / before[key] if before[key] else 1.0
+        flag = 'REGRESSION' if ratio > threshold and after[key] - before[key] > MIN_DELTA else ''
+        print(f'{key[0]:>24} {key[1]:>10} {key[2]:>32} {before[key] * 1000:10.2f} {after[key] * 1000:10.2f} ms '
+              f'{ratio:6.2f}x {flag}')
+        if flag:
+            regressions.append((key, ratio))
+    return regressions
+
+
+def _scale(value):
+    bookings, properties, days = (int(part) for part in value.split(':'))
+    return bookings, properties, days
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark hotel_analysis and the dashboard rerun')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='time the suite and append the results')
+    run_parser.add_argument('--scale', type=_scale, action='append',
+                            help='bookings:properties:days, can be given several times')
+    run_parser.add_argument('--repeat', type=int, default=5)
+    run_parser.add_argument('--chunksize', type=int)
+    run_parser.add_argument('--workers', type=int)
+    compare_parser = commands.add_parser('compare', help='compare two runs, exit 1 on a regression')
+    compare_parser.add_argument('--baseline')
+    compare_parser.add_argument('--current')
+    compare_parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        run(args.scale or SCALES, args.repeat, chunksize=args.chunksize, workers=args.workers)
+    else:
+        try:
+            regressions = compare(baseline=args.baseline, current=args.current, threshold=args.threshold)
+        except ValueError as error:
+            parser.error(str(error))
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,125 @@
+import glob
+import hashlib
+import json
+import os
+
+import pandas as pd
+import pyarrow as pa
+
+from hotel_schema import DATA_DIR, DATE_COLUMNS, SCHEMAS, read_csv
+
+# Parquet copies of the cleaned csv files live next to them in this folder
+CACHE_DIR = '.cache'
+
+
+# Hash a file in blocks so large csv files are never held in memory
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Fingerprint of the schema, so a schema change rebuilds the cache too
+def schema_hash(name):
+    schema = json.dumps([SCHEMAS[name], DATE_COLUMNS[name]], sort_keys=True)
+    return hashlib.sha256(schema.encode()).hexdigest()
+
+
+def read_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(path, manifest):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+
+# Fingerprint of the cleaned csv files behind some datasets (size and mtime of each), cheap to recompute
+def source_version(names, data_dir=DATA_DIR):
+    digest = hashlib.sha256()
+    for name in names:
+        try:
+            stat = os.stat(os.path.join(data_dir, f'{name}.csv'))
+        except FileNotFoundError:
+            continue
+        digest.update(f'{name}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+    return digest.hexdigest()[:16]
+
+
+# Snapshot of a frame built from the data of one version (see write_snapshot)
+def snapshot_path(name, version, data_dir=DATA_DIR):
+    return os.path.join(data_dir, CACHE_DIR, f'{name}-{version}.arrow')
+
+
+# Write a frame as an uncompressed Arrow file that read_snapshot can map, dropping the snapshots of older versions
+def write_snapshot(df, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+    name = os.path.basename(path).rsplit('-', 1)[0]
+    for stale in glob.glob(os.path.join(os.path.dirname(path), f'{glob.escape(name)}-*.arrow')):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except OSError:
+                # Still mapped by another process (on Windows), it goes with the next version
+                pass
+
+
+# Memory-map a snapshot. The columns of the frame point straight into the file's pages and are read-only,
+# so every session and every server process reading the same data shares a single copy through the page cache.
+def read_snapshot(path):
+    table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+# Load a cleaned dataset from its columnar cache, converting the csv only when it changed
+def load_table(name, data_dir=DATA_DIR):
+    source = os.path.join(data_dir, f'{name}.csv')
+    cache_dir = os.path.join(data_dir, CACHE_DIR)
+    parquet_path = os.path.join(cache_dir, f'{name}.parquet')
+    manifest_path = os.path.join(cache_dir, f'{name}.json')
+
+    stat = os.stat(source)
+    manifest = read_manifest(manifest_path)
+    digest = None
+    if manifest and manifest.get('schema') == schema_hash(name) and os.path.exists(parquet_path):
+        if manifest['mtime_ns'] == stat.st_mtime_ns and manifest['size'] == stat.st_size:
+            return pd.read_parquet(parquet_path)
+        # The file was touched, only rebuild when its content really changed
+        digest = file_hash(source)
+        if manifest['sha256'] == digest:
+            manifest.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+            try:
+                write_manifest(manifest_path, manifest)
+            except OSError:
+                pass
+            return pd.read_parquet(parquet_path)
+
+    df = read_csv(name, data_dir)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f'{parquet_path}.{os.getpid()}.tmp'
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, parquet_path)
+        write_manifest(manifest_path, {
+            'sha256': digest or file_hash(source),
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'schema': schema_hash(name),
+        })
+    except OSError:
+        # A read-only data folder still works, it just parses the csv every time
+        pass
+    return df
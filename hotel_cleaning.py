@@ -0,0 +1,158 @@
+import argparse
+import hashlib
+import os
+
+import pandas as pd
+
+from hotel_cache import CACHE_DIR, file_hash, read_manifest, schema_hash, write_manifest
+from hotel_schema import DATA_DIR, DATE_COLUMNS, apply_schema
+
+# Folder with the raw datasets the cleaned ones are made from
+RAW_DIR = 'datasets'
+
+# Raw file behind each cleaned dataset
+SOURCES = {
+    'fact_bookings': 'fact_bookings',
+    'dim_date': 'dim_date',
+    'dim_hotels': 'dim_hotels',
+    'dim_room': 'dim_rooms',
+    'fact_aggregated_bookings': 'fact_aggregated_bookings',
+}
+
+# Date formats found in the raw files, tried in order (the bookings mix several)
+RAW_DATE_FORMATS = {
+    'fact_bookings': ('%d-%m-%y', '%d/%m/%Y', '%d-%b-%y'),
+    'dim_date': ('%d-%b-%y',),
+    'fact_aggregated_bookings': ('%d-%b-%y',),
+}
+
+# Bump when a cleaning step changes, so every dataset is cleaned again
+CLEANING_VERSION = 1
+
+# Raw file hashes of the datasets cleaned last time live in this manifest
+MANIFEST_FILE = 'cleaning.json'
+
+# Line ending of the cleaned csv files, fixed so every platform writes the same bytes
+LINE_TERMINATOR = '\r\n'
+
+
+# Parse raw dates with each known format in turn. A date none of them matches is an error, never a guess.
+def parse_dates(values, formats):
+    parsed = pd.to_datetime(values, format=formats[0], errors='coerce')
+    for date_format in formats[1:]:
+        missing = parsed.isna() & values.notna()
+        if not missing.any():
+            break
+        parsed[missing] = pd.to_datetime(values[missing], format=date_format, errors='coerce')
+    unparsed = values[parsed.isna() & values.notna()]
+    if len(unparsed):
+        raise ValueError(f'Dates in no known format ({", ".join(formats)}): {unparsed.unique()[:5].tolist()}')
+    return parsed
+
+
+def _parse_raw_dates(df, name):
+    for column in DATE_COLUMNS[name]:
+        if column in df.columns:
+            df[column] = parse_dates(df[column], RAW_DATE_FORMATS[name])
+    return df
+
+
+# Drop bookings without guests and revenue outliers (more than 3 standard deviations above the mean),
+# and count missing ratings as 0
+def clean_bookings(df):
+    df = df[df['no_guests'] > 0]
+    higher_limit = df['revenue_generated'].mean() + 3 * df['revenue_generated'].std()
+    df = df[df['revenue_generated'] <= higher_limit]
+    return df.assign(ratings_given=df['ratings_given'].fillna(0))
+
+
+# Column names without spaces and the 'weekeday' typo fixed
+def clean_dates(df):
+    df.columns = [column.replace(' ', '_') for column in df.columns]
+    df['day_type'] = df['day_type'].replace('weekeday', 'weekday')
+    return df
+
+
+# Fill missing capacity with the median and drop cells with more successful bookings than capacity
+def clean_aggregated_bookings(df):
+    df = df.assign(capacity=df['capacity'].fillna(df['capacity'].median()))
+    return df[df['successful_bookings'] <= df['capacity']]
+
+
+CLEANERS = {
+    'fact_bookings': clean_bookings,
+    'dim_date': clean_dates,
+    'dim_hotels': lambda df: df,
+    'dim_room': lambda df: df,
+    'fact_aggregated_bookings': clean_aggregated_bookings,
+}
+
+
+# Read, clean and type one raw dataset
+def clean(name, raw_dir=RAW_DIR):
+    df = pd.read_csv(os.path.join(raw_dir, f'{SOURCES[name]}.csv'))
+    df = CLEANERS[name](df)
+    df = _parse_raw_dates(df, name)
+    return apply_schema(df.reset_index(drop=True), name)
+
+
+# Write a cleaned dataset, dates in the format its schema declares
+def write_cleaned(df, name, out_dir=DATA_DIR):
+    df = df.copy()
+    for column, date_format in DATE_COLUMNS[name].items():
+        if column in df.columns:
+            df[column] = df[column].dt.strftime('%Y-%m-%d' if date_format == 'ISO8601' else date_format)
+    path = os.path.join(out_dir, f'{name}.csv')
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    df.to_csv(tmp_path, index=False, lineterminator=LINE_TERMINATOR)
+    os.replace(tmp_path, path)
+
+
+# Fingerprint of how a dataset is cleaned: the steps' version and the schema it is written with
+def _pipeline_hash(name):
+    return hashlib.sha256(f'{CLEANING_VERSION}:{schema_hash(name)}'.encode()).hexdigest()
+
+
+# Clean every raw dataset whose content (or cleaning) changed since the last run, the others are left alone.
+# Returns the names of the datasets cleaned.
+def run(raw_dir=RAW_DIR, out_dir=DATA_DIR, force=False):
+    manifest_path = os.path.join(out_dir, CACHE_DIR, MANIFEST_FILE)
+    manifest = read_manifest(manifest_path) or {}
+    cleaned = []
+    for name, source in SOURCES.items():
+        source_path = os.path.join(raw_dir, f'{source}.csv')
+        if not os.path.exists(source_path):
+            continue
+        stat = os.stat(source_path)
+        entry = manifest.get(name, {})
+        up_to_date = (
+            not force
+            and entry.get('pipeline') == _pipeline_hash(name)
+            and os.path.exists(os.path.join(out_dir, f'{name}.csv'))
+        )
+        # Size and mtime are checked first, the content is only hashed when they changed
+        if up_to_date and (entry.get('mtime_ns'), entry.get('size')) == (stat.st_mtime_ns, stat.st_size):
+            continue
+        digest = file_hash(source_path)
+        if not (up_to_date and entry.get('sha256') == digest):
+            write_cleaned(clean(name, raw_dir), name, out_dir)
+            cleaned.append(name)
+        manifest[name] = {
+            'sha256': digest,
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'pipeline': _pipeline_hash(name),
+        }
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        write_manifest(manifest_path, manifest)
+    return cleaned
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Clean the raw hotel datasets')
+    parser.add_argument('--raw-dir', default=RAW_DIR)
+    parser.add_argument('--out-dir', default=DATA_DIR)
+    parser.add_argument('--force', action='store_true', help='clean every dataset, changed or not')
+    args = parser.parse_args()
+    cleaned = run(args.raw_dir, args.out_dir, args.force)
+    print(f'Cleaned: {", ".join(cleaned) or "nothing changed"}')
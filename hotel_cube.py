@@ -0,0 +1,102 @@
+import hashlib
+import json
+
+from hotel_schema import concat_frames
+
+# Keys of the capacity cube: one cell per property, room class and day
+CAPACITY_KEYS = ['date', 'mmm_yy', 'week_no', 'week_first_day', 'week_start', 'property_id', 'property_name', 'category', 'city', 'room_class']
+
+# Keys of the booking cube: the capacity keys split further by platform and status
+BOOKING_KEYS = CAPACITY_KEYS + ['booking_platform', 'booking_status']
+
+# Keys a booking cell uses to find the capacity of its room day
+ROOM_DAY_KEYS = ['date', 'property_id', 'room_class']
+
+# Additive measures of each cube
+CAPACITY_MEASURES = ['successful_bookings', 'capacity']
+BOOKING_MEASURES = ['bookings', 'revenue_realized', 'ratings_given', 'rated_bookings']
+
+
+# Measures are summed in 64 bits so totals over many cells cannot overflow the compact load types
+MEASURE_TYPES = {
+    'bookings': 'int64',
+    'revenue_realized': 'int64',
+    'ratings_given': 'float64',
+    'rated_bookings': 'int64',
+    'successful_bookings': 'int64',
+    'capacity': 'int64',
+}
+
+
+# Fingerprint of the cubes' layout (keys, measures and their types), so a snapshot of another layout is never mapped
+def layout_hash():
+    layout = [CAPACITY_KEYS, BOOKING_KEYS, ROOM_DAY_KEYS, CAPACITY_MEASURES, BOOKING_MEASURES, MEASURE_TYPES]
+    return hashlib.sha256(json.dumps(layout, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _widen(cube):
+    return cube.astype({column: dtype for column, dtype in MEASURE_TYPES.items() if column in cube.columns})
+
+
+# Roll up the merged aggregated bookings to capacity and successful bookings per cell
+def build_capacity_cube(df_merged_agg_bookings):
+    return df_merged_agg_bookings.groupby(CAPACITY_KEYS, observed=True, dropna=False).agg(
+        successful_bookings=('successful_bookings', 'sum'),
+        capacity=('capacity', 'sum'),
+    ).reset_index().pipe(_widen)
+
+
+# Roll up the merged bookings to counts and sums per cell. rated_bookings counts the bookings that were rated
+# (a missing rating is cleaned to 0), the ones an average rating is taken over.
+def rollup_bookings(df_merged_bookings):
+    rated = df_merged_bookings.assign(rated=df_merged_bookings['ratings_given'].gt(0))
+    return rated.groupby(BOOKING_KEYS, observed=True, dropna=False).agg(
+        bookings=('booking_id', 'count'),
+        revenue_realized=('revenue_realized', 'sum'),
+        ratings_given=('ratings_given', 'sum'),
+        rated_bookings=('rated', 'sum'),
+    ).reset_index().pipe(_widen)
+
+
+# Give every booking cell the capacity and successful bookings of its room day counted once per booking,
+# the same totals the per-booking rows of merged_bookings add up to
+def add_room_day_measures(cube, capacity_cube):
+    room_days = capacity_cube.groupby(ROOM_DAY_KEYS, observed=True)[CAPACITY_MEASURES].sum()
+    room_days = cube.join(room_days, on=ROOM_DAY_KEYS)
+    cube = cube.copy()
+    for measure in CAPACITY_MEASURES:
+        cube[measure] = (cube['bookings'] * room_days[measure].fillna(0)).astype('int64')
+    return cube
+
+
+def build_booking_cube(df_merged_bookings, capacity_cube):
+    return add_room_day_measures(rollup_bookings(df_merged_bookings), capacity_cube)
+
+
+# Merge partial cubes of the same keys into one, summing the cells they share
+def combine_cubes(cubes, keys, measures):
+    combined = concat_frames(cubes)
+    return combined.groupby(keys, observed=True, dropna=False)[measures].sum().reset_index().pipe(_widen)
+
+
+# Fold a batch cube into a date-sorted cube. Only the cells from the batch's first date on are regrouped,
+# the older part of the cube is kept as it is. Returns the new cube and the first row that changed.
+def update_cube(cube, batch_cube, keys, measures, since):
+    start = int(cube['date'].searchsorted(since))
+    tail = cube.iloc[start:][keys + measures]
+    if batch_cube is not None:
+        tail = combine_cubes([tail, batch_cube[keys + measures]], keys, measures)
+    return concat_frames([cube.iloc[:start][keys + measures], tail]), start
+
+
+def update_capacity_cube(capacity_cube, batch_cube, since):
+    return update_cube(capacity_cube, batch_cube, CAPACITY_KEYS, CAPACITY_MEASURES, since)
+
+
+# The room day measures of the booking cells from the first changed date on are looked up again,
+# so capacity that arrives after its bookings is picked up as well (batch_cube may be None then)
+def update_booking_cube(booking_cube, batch_cube, capacity_cube, since):
+    cube, start = update_cube(booking_cube, batch_cube, BOOKING_KEYS, BOOKING_MEASURES, since)
+    tail = add_room_day_measures(cube.iloc[start:], capacity_cube)
+    head = booking_cube.iloc[:start]
+    return concat_frames([head, tail]), start
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+# Sidebar filter dimensions of the dashboard
+FILTER_COLUMNS = ('room_class', 'property_name', 'city', 'mmm_yy')
+
+
+# Packed bitmap of the rows holding each value of a column
+def _bitmaps(values):
+    codes, uniques = pd.factorize(values)
+    return {value: np.packbits(codes == code) for code, value in enumerate(uniques)}
+
+
+# Row bitmaps per value of every filter dimension, built once per frame.
+# A filter selection is answered by AND-ing a few packed bitmaps instead of comparing strings on every row.
+class FilterIndex:
+    def __init__(self, df, columns=FILTER_COLUMNS):
+        self.size = len(df)
+        self.bitmaps = {column: _bitmaps(df[column]) for column in columns}
+
+    # Index of the frame after its rows from start on changed (or were appended), reusing the bitmaps before start
+    def updated(self, df, start):
+        start -= start % 8
+        index = FilterIndex.__new__(FilterIndex)
+        index.size = len(df)
+        index.bitmaps = {}
+        for column, bitmaps in self.bitmaps.items():
+            tail = _bitmaps(df[column].iloc[start:])
+            empty_tail = np.zeros((len(df) - start + 7) // 8, dtype=np.uint8)
+            empty_head = np.zeros(start // 8, dtype=np.uint8)
+            index.bitmaps[column] = {
+                value: np.concatenate([bitmaps.get(value, empty_head)[:start // 8], tail.get(value, empty_tail)])
+                for value in bitmaps.keys() | tail.keys()
+            }
+        return index
+
+    # Row positions matching every filter, 'All' (or None) leaves that dimension open
+    def positions(self, **filters):
+        selected = None
+        for column, value in filters.items():
+            if value is None or value == 'All':
+                continue
+            bitmap = self.bitmaps[column].get(value)
+            if bitmap is None:
+                return np.empty(0, dtype=np.intp)
+            selected = bitmap if selected is None else selected & bitmap
+        if selected is None:
+            return np.arange(self.size)
+        return np.flatnonzero(np.unpackbits(selected, count=self.size))
+
+    # The filtered rows of the frame the index was built on
+    def take(self, df, **filters):
+        return df.take(self.positions(**filters))
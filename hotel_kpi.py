@@ -0,0 +1,53 @@
+from dataclasses import dataclass
+
+from hotel_timing import timed
+
+
+# Headline metrics of a filter selection, kept numeric so other callers can reuse them
+@dataclass(frozen=True)
+class KPIs:
+    revenue: float
+    bookings: int
+    capacity: int
+    successful_bookings: int
+    adr: float
+    revpar: float
+    occupancy: float
+    dsrn: float
+    dbrn: float
+    durn: float
+    num_days: int
+
+
+def _ratio(numerator, denominator):
+    return numerator / denominator if denominator else 0.0
+
+
+# Compute every headline metric with one grouped pass over each filtered cube
+@timed
+def compute_kpis(filtered_bookings, filtered_agg_bookings):
+    by_status = filtered_bookings.groupby('booking_status', observed=True)[['bookings', 'revenue_realized', 'capacity']].sum()
+    totals = by_status.sum()
+    agg_totals = filtered_agg_bookings[['capacity', 'successful_bookings']].sum()
+
+    dates = filtered_bookings['date']
+    num_days = (dates.max() - dates.min()).days + 1 if len(dates) else 0
+    revenue = float(totals['revenue_realized'])
+    bookings = int(totals['bookings'])
+    capacity = int(agg_totals['capacity'])
+    checked_out = int(by_status['bookings'].get('Checked Out', 0))
+
+    return KPIs(
+        revenue=revenue,
+        bookings=bookings,
+        capacity=capacity,
+        successful_bookings=int(agg_totals['successful_bookings']),
+        adr=_ratio(revenue, bookings),
+        revpar=_ratio(revenue, capacity),
+        occupancy=_ratio(agg_totals['successful_bookings'], capacity),
+        # Sellable nights use the room day capacity of each booking, like the DSRN card always has
+        dsrn=_ratio(totals['capacity'], num_days),
+        dbrn=_ratio(bookings, num_days),
+        durn=_ratio(checked_out, num_days),
+        num_days=num_days,
+    )
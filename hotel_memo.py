@@ -0,0 +1,172 @@
+import functools
+import hashlib
+import importlib.util
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from hotel_cache import CACHE_DIR, file_hash
+
+# hotel_precompute writes its results to this file in the columnar cache folder of the data
+PRECOMPUTED_FILE = 'precomputed.sqlite'
+
+# Modules the precomputed results are computed with, a change to any of them makes the stored results stale
+RESULT_MODULES = ('hotel_analysis', 'hotel_kpi', 'hotel_cube', 'hotel_prefix', 'hotel_index', 'hotel_backend',
+                  'hotel_store', 'hotel_schema')
+
+
+# Bounded LRU cache for results computed from one version of the data.
+# Asking with a new data version drops everything cached for the previous one. Versions replaced that way
+# are retired: a rerun still finishing on one computes without caching instead of dropping the newer results.
+class ResultCache:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.version = None
+        self._retired = set()
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Return the cached result for the key, computing and storing it on a miss
+    def get_or_compute(self, version, key, compute):
+        with self._lock:
+            if version in self._retired:
+                self.misses += 1
+                return compute()
+            if version != self.version:
+                self._results.clear()
+                if self.version is not None:
+                    self._retired.add(self.version)
+                self.version = version
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return self._results[key]
+            self.misses += 1
+
+        result = compute()
+        with self._lock:
+            # A result computed while the data changed belongs to the old version, don't keep it
+            if version == self.version:
+                self._results[key] = result
+                self._results.move_to_end(key)
+                while len(self._results) > self.maxsize:
+                    self._results.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'version': self.version,
+                'size': len(self._results),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+def precomputed_path(data_dir):
+    return os.path.join(data_dir, CACHE_DIR, PRECOMPUTED_FILE)
+
+
+# Fingerprint of the source of the modules computing the results, hashed once per process
+@functools.cache
+def code_hash():
+    digest = hashlib.sha256()
+    for name in RESULT_MODULES:
+        digest.update(file_hash(importlib.util.find_spec(name).origin).encode())
+    return digest.hexdigest()[:16]
+
+
+# Version precomputed results are stored under: the data they were computed from and the code that computed them
+def results_version(version):
+    return f'{version}:{code_hash()}'
+
+
+def _dtype(dtype):
+    if isinstance(dtype, pd.CategoricalDtype):
+        return {'categories': dtype.categories.tolist()}
+    return str(dtype)
+
+
+# Results are stored as json: frames split into columns and rows (with their types), dicts of tuples as lists
+def encode(value):
+    if isinstance(value, pd.DataFrame):
+        dtypes = {column: _dtype(dtype) for column, dtype in value.dtypes.items()}
+        return json.dumps({'frame': value.to_dict('split'), 'dtypes': dtypes})
+    if isinstance(value, dict):
+        return json.dumps({'dict': value})
+    return json.dumps({'value': value})
+
+
+def decode(text):
+    stored = json.loads(text)
+    if 'frame' in stored:
+        dtypes = {
+            column: pd.CategoricalDtype(dtype['categories']) if isinstance(dtype, dict) else dtype
+            for column, dtype in stored['dtypes'].items()
+        }
+        return pd.DataFrame(**stored['frame']).astype(dtypes)
+    if 'dict' in stored:
+        return {key: tuple(item) if isinstance(item, list) else item for key, item in stored['dict'].items()}
+    return stored['value']
+
+
+# Read side of the results written by hotel_precompute: one row per results version (see results_version),
+# result name and selection.
+# Lookups go through the primary key, and a missing or unreadable file just means nothing is precomputed.
+class PrecomputedResults:
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+        self._versions = set()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._connection is None and os.path.exists(self.path):
+            self._connection = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, check_same_thread=False)
+        return self._connection
+
+    # Whether a batch run wrote results for the version. A version found is remembered, one not found is
+    # looked up again next time (a cheap key lookup) so a batch run finishing later is picked up.
+    def has_version(self, version):
+        version = results_version(version)
+        with self._lock:
+            if version not in self._versions:
+                try:
+                    connection = self._connect()
+                    if connection and connection.execute(
+                            'SELECT 1 FROM results WHERE version = ? LIMIT 1', (version,)).fetchone():
+                        self._versions.add(version)
+                except sqlite3.Error:
+                    return False
+            return version in self._versions
+
+    def get(self, version, name, key):
+        if not self.has_version(version):
+            return None
+        with self._lock:
+            try:
+                row = self._connect().execute(
+                    'SELECT value FROM results WHERE version = ? AND name = ? AND key = ?',
+                    (results_version(version), name, json.dumps(key)),
+                ).fetchone()
+            except sqlite3.Error:
+                return None
+        return decode(row[0]) if row else None
+
+    # The precomputed result, or the live one for data newer than the last batch run
+    def get_or_compute(self, version, name, key, compute):
+        result = self.get(version, name, key)
+        return compute() if result is None else result
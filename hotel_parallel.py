@@ -0,0 +1,38 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from hotel_cube import (BOOKING_KEYS, BOOKING_MEASURES, CAPACITY_KEYS, CAPACITY_MEASURES, add_room_day_measures,
+                        build_capacity_cube, combine_cubes, rollup_bookings)
+
+# Facts are partitioned by property (or by month with column='mmm_yy'), the cells of one value never span two partitions
+PARTITION_COLUMN = 'property_id'
+
+
+# Split the rows into at most parts partitions, every value of the column going to exactly one of them
+def partitions(df, parts, column=PARTITION_COLUMN):
+    codes, _ = pd.factorize(df[column], sort=True)
+    buckets = codes % parts
+    return [df.take(np.flatnonzero(buckets == part)) for part in range(parts) if (buckets == part).any()]
+
+
+# Roll up the partitions in a process pool and merge the partial cubes. The merge regroups them sorted by key,
+# so the result doesn't depend on which worker finishes first and matches the serial rollup.
+def parallel_rollup(df, rollup, keys, measures, workers, column=PARTITION_COLUMN):
+    parts = partitions(df, workers, column)
+    if len(parts) < 2:
+        return rollup(df)
+    with ProcessPoolExecutor(workers) as pool:
+        partials = list(pool.map(rollup, parts))
+    return combine_cubes(partials, keys, measures)
+
+
+def parallel_capacity_cube(df_merged_agg_bookings, workers, column=PARTITION_COLUMN):
+    return parallel_rollup(df_merged_agg_bookings, build_capacity_cube, CAPACITY_KEYS, CAPACITY_MEASURES,
+                           workers, column)
+
+
+def parallel_booking_cube(df_merged_bookings, capacity_cube, workers, column=PARTITION_COLUMN):
+    cube = parallel_rollup(df_merged_bookings, rollup_bookings, BOOKING_KEYS, BOOKING_MEASURES, workers, column)
+    return add_room_day_measures(cube, capacity_cube)
@@ -0,0 +1,97 @@
+import argparse
+import itertools
+import json
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import hotel_analysis
+from hotel_memo import encode, precomputed_path, results_version
+from hotel_schema import DATA_DIR
+from hotel_store import HotelDataStore
+
+# Results written for every filter selection, the ones the dashboard computes on each rerun
+PRECOMPUTED = ('metric_cards', 'property_metrics')
+
+# Store of the worker process, each worker loads the data once
+_store = None
+
+
+# Every value each sidebar filter offers, 'All' first, as hotel_app lists them
+def filter_values(store):
+    return (
+        ['All'] + list(store.df_dates['mmm_yy'].dropna().unique()),
+        ['All'] + list(store.df_rooms['room_class'].unique()),
+        ['All'] + list(store.df_hotels['city'].unique()),
+        ['All'] + list(store.df_hotels['property_name'].unique()),
+    )
+
+
+def _init_worker(data_dir):
+    global _store
+    _store = HotelDataStore(data_dir)
+
+
+# Results of one month, room class and city for every hotel. The property table keeps every hotel,
+# so one table is computed for the whole group.
+def _compute_group(month, room_type, city, hotels):
+    rows = []
+    metrics = None
+    for hotel in hotels:
+        selection = hotel_analysis.Selection(month, room_type, city, hotel, data_store=_store)
+        if metrics is None:
+            metrics = encode(hotel_analysis.property_metrics(selection.property_bookings))
+        rows.append(('metric_cards', json.dumps(selection.key), encode(hotel_analysis.metric_cards(selection))))
+        rows.append(('property_metrics', json.dumps(selection.key), metrics))
+    return rows
+
+
+def _connect(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path)
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS results ('
+        'version TEXT, name TEXT, key TEXT, value TEXT, PRIMARY KEY (version, name, key)) WITHOUT ROWID'
+    )
+    return connection
+
+
+# Precompute the results of every filter selection of the current data in a process pool.
+# Each finished group is committed on its own, so an interrupted run picks up where it stopped.
+def precompute(data_dir=DATA_DIR, workers=None):
+    store = HotelDataStore(data_dir)
+    # Results of the same data computed by other code are stale
+    version = results_version(store.version)
+    months, room_types, cities, hotels = filter_values(store)
+    connection = _connect(precomputed_path(data_dir))
+    done = {key for (key,) in connection.execute(
+        'SELECT key FROM results WHERE version = ? AND name = ?', (version, PRECOMPUTED[-1]))}
+
+    groups = [
+        group for group in itertools.product(months, room_types, cities)
+        if any(json.dumps(group + (hotel,)) not in done for hotel in hotels)
+    ]
+    total = len(months) * len(room_types) * len(cities)
+    print(f'Version {version}: {total - len(groups)} of {total} groups already done')
+
+    with ProcessPoolExecutor(workers or os.cpu_count(), initializer=_init_worker, initargs=(data_dir,)) as pool:
+        futures = [pool.submit(_compute_group, *group, hotels) for group in groups]
+        for count, future in enumerate(as_completed(futures), 1):
+            with connection:
+                connection.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                                       [(version, name, key, value) for name, key, value in future.result()])
+            print(f'{count}/{len(groups)} groups written')
+
+    # Only the current data is ever served, results of older data are dropped once it is complete
+    with connection:
+        connection.execute('DELETE FROM results WHERE version != ?', (version,))
+    connection.close()
+    return version
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precompute the dashboard results of every filter selection')
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+    precompute(args.data_dir, args.workers)
@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+
+# Measures kept as running daily totals: the cube each comes from, the column summed and the booking
+# status it is limited to (None for every status)
+MEASURES = {
+    'revenue': ('booking_cube', 'revenue_realized', None),
+    'bookings': ('booking_cube', 'bookings', None),
+    'cancellations': ('booking_cube', 'bookings', 'Cancelled'),
+    'capacity': ('capacity_cube', 'capacity', None),
+    'successful_bookings': ('capacity_cube', 'successful_bookings', None),
+}
+
+
+def _all(value):
+    return value is None or value == 'All'
+
+
+# Cumulative daily totals of every measure per property and room class, built once from the cubes.
+# The total of any date range is the difference of two entries per property and room class,
+# so custom ranges, rolling windows and period comparisons never scan the facts again.
+class PrefixSums:
+    def __init__(self, booking_cube, capacity_cube):
+        cubes = {'booking_cube': booking_cube, 'capacity_cube': capacity_cube}
+        dates = pd.concat([booking_cube['date'], capacity_cube['date']]).dropna()
+        self.dates = pd.date_range(dates.min(), dates.max(), freq='D') if len(dates) else pd.DatetimeIndex([])
+        properties = pd.concat([cube[['property_id', 'property_name', 'city']] for cube in cubes.values()])
+        properties = properties.dropna(subset=['property_id']).drop_duplicates('property_id')
+        self.properties = properties.set_index('property_id').sort_index()
+        self.room_classes = pd.Index(pd.concat([cube['room_class'] for cube in cubes.values()]).dropna().unique())
+
+        shape = (len(self.properties), len(self.room_classes), len(self.dates))
+        # Flat cell (property, room class, day) of every cube row, -1 for rows outside the arrays
+        flat = {}
+        for cube_name, cube in cubes.items():
+            cells = (
+                self.properties.index.get_indexer(cube['property_id']),
+                self.room_classes.get_indexer(cube['room_class']),
+                self.dates.get_indexer(cube['date']),
+            )
+            known = (cells[0] >= 0) & (cells[1] >= 0) & (cells[2] >= 0)
+            flat[cube_name] = np.full(len(cube), -1)
+            if len(self.dates):
+                flat[cube_name][known] = np.ravel_multi_index(tuple(cell[known] for cell in cells), shape)
+
+        self.sums = {}
+        for measure, (cube_name, column, status) in MEASURES.items():
+            rows = flat[cube_name] >= 0
+            if status is not None:
+                rows &= (cubes[cube_name]['booking_status'] == status).to_numpy()
+            daily = np.bincount(flat[cube_name][rows], weights=cubes[cube_name][column].to_numpy()[rows],
+                                minlength=int(np.prod(shape)))
+            sums = np.zeros(shape[:2] + (shape[2] + 1,), dtype='int64')
+            sums[..., 1:] = np.cumsum(daily.reshape(shape).round().astype('int64'), axis=2)
+            self.sums[measure] = sums
+        self._running_totals = {}
+
+    # Rows (properties) and columns (room classes) of the sidebar filters, 'All' keeps every one
+    def _cells(self, room_class='All', city='All', hotel='All'):
+        properties = np.ones(len(self.properties), dtype=bool)
+        if not _all(city):
+            properties &= (self.properties['city'] == city).to_numpy()
+        if not _all(hotel):
+            properties &= (self.properties['property_name'] == hotel).to_numpy()
+        rooms = np.ones(len(self.room_classes), dtype=bool) if _all(room_class) else self.room_classes == room_class
+        return np.flatnonzero(properties), np.flatnonzero(rooms)
+
+    # Position of the first day on or after start, and of the day after end (both inclusive, None is open)
+    def _days(self, start, end):
+        first = 0 if start is None else self.dates.searchsorted(pd.Timestamp(start))
+        last = len(self.dates) if end is None else self.dates.searchsorted(pd.Timestamp(end), side='right')
+        return first, max(first, last)
+
+    # Totals of every measure from start to end (inclusive) for the sidebar filters
+    def totals(self, start=None, end=None, room_class='All', city='All', hotel='All'):
+        first, last = self._days(start, end)
+        properties, rooms = self._cells(room_class, city, hotel)
+        totals = {}
+        for measure, sums in self.sums.items():
+            cells = sums[np.ix_(properties, rooms)]
+            totals[measure] = int((cells[..., last] - cells[..., first]).sum())
+        totals['days'] = int(last - first)
+        return totals
+
+    # Running totals of the selected cells, summed over properties and room classes: one value per day plus
+    # a leading 0. Kept per filter selection, so every window and range of the selection reuses them.
+    def _running(self, room_class='All', city='All', hotel='All'):
+        key = (room_class, city, hotel)
+        running = self._running_totals.get(key)
+        if running is None:
+            properties, rooms = self._cells(room_class, city, hotel)
+            running = {measure: sums[np.ix_(properties, rooms)].sum(axis=(0, 1)) for measure, sums in self.sums.items()}
+            self._running_totals[key] = running
+        return running
+
+    # Totals of every measure on each day from start to end (inclusive) for the sidebar filters, indexed by date
+    def daily(self, start=None, end=None, **filters):
+        first, last = self._days(start, end)
+        running = self._running(**filters)
+        return pd.DataFrame({measure: np.diff(values[first:last + 1]) for measure, values in running.items()},
+                            index=self.dates[first:last])
+
+    # Totals of every measure over the `window` days up to each day from start to end, and the number of days
+    # each one covers (fewer at the start of the data). Two lookups per day, whatever the window.
+    def rolling(self, window, start=None, end=None, **filters):
+        first, last = self._days(start, end)
+        running = self._running(**filters)
+        upper = np.arange(first + 1, last + 1)
+        lower = np.maximum(upper - window, 0)
+        totals = {measure: values[upper] - values[lower] for measure, values in running.items()}
+        totals['days'] = upper - lower
+        return pd.DataFrame(totals, index=self.dates[first:last])
+
+    # Totals of the `days` days up to end (the last day with data by default), a rolling 7 or 28 day window
+    def window(self, days, end=None, **filters):
+        end = self.dates[-1] if end is None else pd.Timestamp(end)
+        return self.totals(end - pd.Timedelta(days=days - 1), end, **filters)
+
+    # Totals of a date range and of the period of the same length right before it. within=(first, last) keeps
+    # both inside those days (a month): the range is narrowed to them and the previous period can come out shorter.
+    def compare(self, start, end, within=None, **filters):
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        if within is not None:
+            start, end = max(start, pd.Timestamp(within[0])), min(end, pd.Timestamp(within[1]))
+        length = end - start + pd.Timedelta(days=1)
+        previous_start = start - length if within is None else max(start - length, pd.Timestamp(within[0]))
+        return self.totals(start, end, **filters), self.totals(previous_start, end - length, **filters)
@@ -0,0 +1,121 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Bookings are sampled separately in every property and month, so small hotels and quiet months are never missed
+STRATA = ['property_id', 'mmm_yy']
+
+# Columns of the merged bookings the estimates need
+SAMPLE_COLUMNS = STRATA + ['date', 'property_name', 'city', 'room_class', 'revenue_realized']
+
+# Bookings kept per stratum, the margins shrink with its square root
+PER_STRATUM = 100
+
+# Normal quantile of the intervals (95%)
+Z = 1.96
+
+# Seed of the sample's random keys, fixed so a preview of the same data is the same on every server. Kept apart
+# from the seeds data generators use (0, 1, ...), whose draws would line up with the generated columns.
+SEED = 0x5EED
+
+
+# An estimated value and its confidence interval
+@dataclass(frozen=True)
+class Estimate:
+    value: float
+    low: float
+    high: float
+
+    @property
+    def margin(self):
+        return (self.high - self.low) / 2
+
+    def scaled(self, factor):
+        return Estimate(self.value * factor, self.low * factor, self.high * factor)
+
+
+def _estimate(value, variance):
+    margin = Z * np.sqrt(max(variance, 0.0))
+    return Estimate(float(value), float(value - margin), float(value + margin))
+
+
+def _open(value):
+    return value is None or value == 'All'
+
+
+# The k bookings with the smallest random keys of every stratum: a uniform sample of each that can be kept
+# up to date chunk by chunk
+def _bottom_k(df, k):
+    df = df.sort_values('_key', kind='stable')
+    return df[df.groupby(STRATA, observed=True).cumcount() < k]
+
+
+# Stratified random sample of the bookings, per_stratum bookings of every property and month, with the size
+# of each stratum. Filter selections are estimated from it in a few milliseconds whatever the size of the
+# history: totals with the stratified estimator, ratios (ADR) by linearization. Only the metric cards are
+# previewed, the realization and the platform and city shares are charts and are always drawn exact.
+class PreviewSample:
+    def __init__(self, chunks, per_stratum=PER_STRATUM, seed=SEED):
+        rng = np.random.default_rng(seed)
+        sample, sizes = None, None
+        for chunk in chunks:
+            chunk = chunk[SAMPLE_COLUMNS].assign(_key=rng.random(len(chunk)))
+            counts = chunk.groupby(STRATA, observed=True).size()
+            sizes = counts if sizes is None else sizes.add(counts, fill_value=0)
+            sample = _bottom_k(chunk if sample is None else pd.concat([sample, chunk]), per_stratum)
+        if sample is None:
+            raise ValueError('No bookings to sample')
+
+        self.sample = sample.drop(columns='_key').reset_index(drop=True)
+        # Stratum of every sampled booking, with the bookings sampled from and held by each stratum
+        self.strata, keys = pd.MultiIndex.from_frame(self.sample[STRATA]).factorize()
+        self.sampled = np.bincount(self.strata, minlength=len(keys)).astype('float64')
+        self.sizes = sizes.reindex(keys).to_numpy(dtype='float64')
+
+    # Sampled rows of the selection's strata (month, city and hotel pick whole strata) and, among them,
+    # the rows in the selection (room class and dates pick single bookings)
+    def _rows(self, month, room_type, city, hotel, dates):
+        sample = self.sample
+        rows = np.ones(len(sample), dtype=bool)
+        for column, value in (('mmm_yy', month), ('city', city), ('property_name', hotel)):
+            if not _open(value):
+                rows &= (sample[column] == value).to_numpy()
+        rows = np.flatnonzero(rows)
+        selected = np.ones(len(rows), dtype=bool)
+        if not _open(room_type):
+            selected &= (sample['room_class'].to_numpy()[rows] == room_type)
+        if dates is not None:
+            days = sample['date'].to_numpy()[rows]
+            selected &= (days >= np.datetime64(pd.Timestamp(dates[0]))) & (days <= np.datetime64(pd.Timestamp(dates[1])))
+        return rows, selected
+
+    # Estimated population total of y over the sampled rows, and its variance
+    def _total(self, rows, y):
+        strata = self.strata[rows]
+        size = len(self.sampled)
+        n, N = self.sampled, self.sizes
+        sums = np.bincount(strata, y, minlength=size)
+        squares = np.bincount(strata, y * y, minlength=size)
+        mean = sums / n
+        spread = np.where(n > 1, (squares - n * mean ** 2) / np.maximum(n - 1, 1), 0.0)
+        return float((N * mean).sum()), float((N ** 2 * (1 - n / N) * spread / n).sum())
+
+    def _ratio(self, rows, y, x):
+        y_total, _ = self._total(rows, y)
+        x_total, _ = self._total(rows, x)
+        ratio = y_total / x_total if x_total else 0.0
+        _, variance = self._total(rows, y - ratio * x)
+        return _estimate(ratio, variance / x_total ** 2 if x_total else 0.0)
+
+    # Revenue, bookings and ADR of a filter selection (the sidebar filters and an optional date range),
+    # the estimates the preview metric cards show
+    def estimate(self, month='All', room_type='All', city='All', hotel='All', dates=None):
+        rows, selected = self._rows(month, room_type, city, hotel, dates)
+        booked = selected.astype('float64')
+        revenue = np.where(selected, self.sample['revenue_realized'].to_numpy(dtype='float64')[rows], 0.0)
+        return {
+            'revenue': _estimate(*self._total(rows, revenue)),
+            'bookings': _estimate(*self._total(rows, booked)),
+            'adr': self._ratio(rows, revenue, booked),
+        }
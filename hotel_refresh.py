@@ -0,0 +1,87 @@
+import logging
+import os
+import threading
+
+import hotel_analysis
+from hotel_cache import source_version
+from hotel_store import CUBES, TABLES, HotelDataStore
+
+# Refreshes (and failed ones) are logged here
+logger = logging.getLogger('hotel_refresh')
+
+# Seconds between two looks at the data folder, HOTEL_REFRESH_INTERVAL=0 turns refreshing off
+INTERVAL = float(os.environ.get('HOTEL_REFRESH_INTERVAL', 30))
+
+# Frames a new store loads before it is swapped in: everything a dashboard rerun reads
+WARM = ('df_dates', 'df_hotels', 'df_rooms') + CUBES
+
+
+# Build what every dashboard rerun needs of a store that is not built on first use: the filter indexes and the
+# prefix sums. The preview sample reads the whole booking file and only serves preview mode, it is drawn in the
+# background the first time preview mode asks for it (see hotel_analysis.preview_tab_cards).
+def warm_derived(store):
+    for cube in CUBES:
+        store.filter_index(cube)
+    store.prefix_sums
+    return store
+
+
+# A store for the files as they are now, with the frames, filter indexes and prefix sums the dashboard needs
+# already built, so the first rerun on it pays no loading cost
+def build_store(current):
+    store = HotelDataStore(current.data_dir, chunksize=current.chunksize, workers=current.workers)
+    store.warm(WARM)
+    return warm_derived(store)
+
+
+# Watches the size and mtime of the cleaned files. Once they changed and then held still for an interval
+# (so a file still being written is never read), the next store is built on this thread and swapped into
+# hotel_analysis in one assignment. Reruns holding the old store finish on it, the next ones get the new one.
+class Refresher(threading.Thread):
+    def __init__(self, interval=INTERVAL):
+        super().__init__(name='hotel-refresh', daemon=True)
+        self.interval = interval
+        self.swaps = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        # The store serving when the app started gets the same head start
+        try:
+            warm_derived(hotel_analysis.store)
+        except Exception:
+            logger.exception('Warming %s failed, it is built on first use instead', hotel_analysis.store.data_dir)
+        loaded = hotel_analysis.store.version.split('+')[0]
+        seen, failed = loaded, None
+        while not self._stopped.wait(self.interval):
+            current = hotel_analysis.store
+            version = source_version(TABLES.values(), current.data_dir)
+            changing, seen = version != seen, version
+            if version in (loaded, failed) or changing:
+                continue
+            try:
+                store = build_store(current)
+            except Exception:
+                logger.exception('Refreshing %s failed, still serving version %s', current.data_dir, loaded)
+                failed = version
+                continue
+            hotel_analysis.store = store
+            loaded = store.version
+            self.swaps += 1
+            logger.info('Serving version %s of %s', loaded, current.data_dir)
+
+    def stop(self):
+        self._stopped.set()
+
+
+_refresher = None
+_lock = threading.Lock()
+
+
+# Start the refresher of this process, once (every rerun can call it)
+def start(interval=INTERVAL):
+    global _refresher
+    with _lock:
+        if interval > 0 and (_refresher is None or not _refresher.is_alive()):
+            _refresher = Refresher(interval)
+            _refresher.start()
+    return _refresher
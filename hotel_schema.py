@@ -0,0 +1,164 @@
+import warnings
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Folder with the cleaned datasets produced by hotel_cleaning
+DATA_DIR = 'cleaned datasets'
+
+# Column types for every cleaned dataset (date columns are listed in DATE_COLUMNS).
+# Low-cardinality text is stored as categories and numbers in the smallest type that fits,
+# so the merged frames stay a fraction of their object/int64 size in memory.
+SCHEMAS = {
+    'fact_bookings': {
+        'booking_id': 'object',
+        'property_id': 'int32',
+        'no_guests': 'float32',
+        'room_category': 'category',
+        'booking_platform': 'category',
+        'ratings_given': 'float32',
+        'booking_status': 'category',
+        'revenue_generated': 'int32',
+        'revenue_realized': 'int32',
+    },
+    'dim_date': {
+        'mmm_yy': 'category',
+        'week_no': 'category',
+        'day_type': 'category',
+    },
+    'dim_hotels': {
+        'property_id': 'int32',
+        'property_name': 'category',
+        'category': 'category',
+        'city': 'category',
+    },
+    'dim_room': {
+        'room_id': 'category',
+        'room_class': 'category',
+    },
+    'fact_aggregated_bookings': {
+        'property_id': 'int32',
+        'room_category': 'category',
+        'successful_bookings': 'int32',
+        'capacity': 'int32',
+    },
+    'merged_bookings_data': {
+        'booking_id': 'object',
+        'property_id': 'int32',
+        'no_guests': 'float32',
+        'room_category': 'category',
+        'booking_platform': 'category',
+        'ratings_given': 'float32',
+        'booking_status': 'category',
+        'revenue_generated': 'int32',
+        'revenue_realized': 'int32',
+        # Left joined onto the bookings, so these can be missing and stay float64 for exact sums
+        'successful_bookings': 'float64',
+        'capacity': 'float64',
+        'room_id': 'category',
+        'room_class': 'category',
+        'property_name': 'category',
+        'category': 'category',
+        'city': 'category',
+        'mmm_yy': 'category',
+        'week_no': 'category',
+        'day_type': 'category',
+    },
+}
+
+# Date columns and the exact format they are written in, so nothing has to be guessed.
+# hotel_cleaning writes every cleaned dataset with ISO dates (merged_bookings_data is not made by it).
+DATE_COLUMNS = {
+    'fact_bookings': {
+        'booking_date': '%Y-%m-%d',
+        'check_in_date': '%Y-%m-%d',
+        'checkout_date': '%Y-%m-%d',
+    },
+    'dim_date': {'date': '%Y-%m-%d'},
+    'dim_hotels': {},
+    'dim_room': {},
+    'fact_aggregated_bookings': {'check_in_date': '%Y-%m-%d'},
+    'merged_bookings_data': {
+        'booking_date': '%d-%b-%y',
+        'check_in_date': 'ISO8601',
+        'checkout_date': '%d-%b-%y',
+        'date': 'ISO8601',
+    },
+}
+
+# Format the notebook wrote the fact tables' dates in. Files it cleaned are still read, with a warning,
+# until hotel_cleaning rewrites them with ISO dates.
+LEGACY_DATE_FORMATS = {
+    'fact_bookings': '%d-%b-%y',
+    'fact_aggregated_bookings': '%d-%b-%y',
+}
+
+
+# Parse a cleaned csv with its explicit schema
+def read_csv(name, data_dir=DATA_DIR):
+    df = pd.read_csv(f'{data_dir}/{name}.csv', dtype=SCHEMAS[name])
+    return apply_dates(df, name)
+
+
+# Read a cleaned csv as a stream of frames of at most chunksize rows, each with the dataset's schema
+def read_chunks(name, chunksize, data_dir=DATA_DIR):
+    with pd.read_csv(f'{data_dir}/{name}.csv', dtype=SCHEMAS[name], chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield apply_dates(chunk, name)
+
+
+# Give rows that did not come from read_csv (an appended batch for example) the schema of their dataset
+def apply_schema(df, name):
+    types = {column: dtype for column, dtype in SCHEMAS[name].items() if column in df.columns}
+    return apply_dates(df.astype(types), name)
+
+
+# Concatenate frames keeping categorical columns categorical, new categories are added after the known ones
+def concat_frames(frames):
+    frames = list(frames)
+    for column, dtype in frames[0].dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype) and any(frame[column].dtype != dtype for frame in frames):
+            parts = [frame[column].astype('category') for frame in frames]
+            merged_dtype = pd.CategoricalDtype(union_categoricals(parts, ignore_order=True).categories)
+            frames = [frame.astype({column: merged_dtype}) for frame in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+# Convert the date columns of a dataset using their declared format
+def apply_dates(df, name):
+    for column, date_format in DATE_COLUMNS[name].items():
+        if column in df.columns and not pd.api.types.is_datetime64_any_dtype(df[column]):
+            try:
+                df[column] = pd.to_datetime(df[column], format=date_format)
+            except ValueError:
+                legacy_format = LEGACY_DATE_FORMATS.get(name)
+                if legacy_format is None:
+                    raise
+                warnings.warn(f'{name}.csv has {column} in the notebook\'s {legacy_format} format, '
+                              'run python hotel_cleaning.py to rewrite it with ISO dates', stacklevel=2)
+                df[column] = pd.to_datetime(df[column], format=legacy_format)
+    return df
+
+
+# Memory used by each frame, deep so the strings behind object columns are counted
+def memory_report(frames):
+    rows = []
+    for name, df in frames.items():
+        usage = df.memory_usage(deep=True)
+        rows.append({
+            'frame': name,
+            'rows': len(df),
+            'columns': df.shape[1],
+            'memory_mb': usage.sum() / 1_000_000,
+            'largest_column': usage.drop('Index').idxmax() if df.shape[1] else None,
+        })
+    report = pd.DataFrame(rows, columns=['frame', 'rows', 'columns', 'memory_mb', 'largest_column'])
+    return report.sort_values('memory_mb', ascending=False, ignore_index=True)
+
+
+# First day of the week week_no numbers (weeks start on Sunday), a date so weeks of different years never mix,
+# and calendar week start (Monday), derived once when the dates load
+def add_week_keys(df_dates):
+    df_dates['week_first_day'] = df_dates['date'] - pd.to_timedelta((df_dates['date'].dt.dayofweek + 1) % 7, unit='D')
+    df_dates['week_start'] = df_dates['date'] - pd.to_timedelta(df_dates['date'].dt.dayofweek, unit='D')
+    return df_dates
@@ -0,0 +1,353 @@
+import itertools
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from hotel_cache import load_table, read_snapshot, snapshot_path, source_version, write_snapshot
+from hotel_cube import (build_booking_cube, build_capacity_cube, layout_hash, rollup_bookings, update_booking_cube,
+                        update_capacity_cube)
+from hotel_index import FilterIndex
+from hotel_parallel import parallel_booking_cube, parallel_capacity_cube
+from hotel_prefix import PrefixSums
+from hotel_preview import PreviewSample
+from hotel_schema import DATA_DIR, add_week_keys, apply_schema, concat_frames, memory_report, read_chunks
+from hotel_stream import stream_booking_cube, stream_capacity_cube
+
+# Raw tables of the store and the cleaned dataset each one is read from
+TABLES = {
+    'df_bookings': 'fact_bookings',
+    'df_dates': 'dim_date',
+    'df_hotels': 'dim_hotels',
+    'df_rooms': 'dim_room',
+    'df_aggregated_bookings': 'fact_aggregated_bookings',
+    'merged_bookings': 'merged_bookings_data',
+}
+
+# Facts joined with the room, hotel and date dimensions, and the fact table behind each
+MERGED = {
+    'df_merged_bookings': 'df_bookings',
+    'df_merged_agg_bookings': 'df_aggregated_bookings',
+}
+
+# Rollup cubes the dashboard KPIs and charts are computed from
+CUBES = ('capacity_cube', 'booking_cube')
+
+FRAMES = tuple(TABLES) + tuple(MERGED) + CUBES
+
+# Fact table and merged frame each cube is rolled up from
+CUBE_SOURCES = {
+    'capacity_cube': ('df_aggregated_bookings', 'df_merged_agg_bookings'),
+    'booking_cube': ('df_bookings', 'df_merged_bookings'),
+}
+
+# Rows per chunk the preview sample reads the bookings in, when the store does not stream them anyway
+PREVIEW_CHUNKSIZE = 200_000
+
+
+# Row of the dimension each fact key points at (-1 when it has none).
+# Categorical keys are looked up once per category and the codes mapped through, not once per row.
+def dimension_positions(keys, dimension_keys):
+    index = pd.Index(dimension_keys)
+    if isinstance(keys.dtype, pd.CategoricalDtype):
+        lookup = index.get_indexer(keys.cat.categories)
+        codes = keys.cat.codes.to_numpy()
+        return np.where(codes >= 0, lookup[codes], -1)
+    return index.get_indexer(keys)
+
+
+# Join a fact table with the room, hotel and date dimensions. The dimensions are tiny, so every attribute is
+# gathered from its dimension by row position instead of hash-joining (and copying) the wide frame three times.
+# The result has the columns and types the left merges on room_id, property_id and date give.
+def enrich(facts, df_rooms, df_hotels, df_dates):
+    columns = {column: facts[column].array for column in facts.columns}
+    for key, dimension, dimension_key in (
+        ('room_category', df_rooms, 'room_id'),
+        ('property_id', df_hotels, 'property_id'),
+        ('check_in_date', df_dates, 'date'),
+    ):
+        positions = dimension_positions(facts[key], dimension[dimension_key])
+        for column in dimension.columns:
+            if column not in columns:
+                values = dimension[column]
+                values = values.array if isinstance(values.dtype, pd.api.extensions.ExtensionDtype) else values.to_numpy()
+                columns[column] = pd.api.extensions.take(values, positions, allow_fill=True)
+    return pd.DataFrame(columns, index=pd.RangeIndex(len(facts)))
+
+
+# Exposes each frame as an attribute that is loaded (or joined) on first access and then kept
+def _frame(name):
+    return property(lambda self: self.get(name))
+
+
+# Lazy, memoized access to the hotel datasets.
+# With a chunksize the cubes are streamed from the fact files chunk by chunk, so the dashboard never holds
+# the full booking history in memory; the raw and merged frames are then only loaded if asked for directly.
+# With workers the cubes are rolled up in a process pool, partitioned by property (or by chunk when streaming).
+# Once a cube is built, the facts and merged frame it was rolled up from are dropped: the dashboard only reads
+# the cubes and the dimensions.
+class HotelDataStore:
+    def __init__(self, data_dir=DATA_DIR, chunksize=None, workers=None):
+        self.data_dir = data_dir
+        self.chunksize = chunksize
+        self.workers = workers
+        self._batches = []
+        self._dropped = set()
+        self._frames = {}
+        self._mapped = set()
+        self._indexes = {}
+        self._derived = {}
+        self._backends = {}
+        self._pending = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._append_lock = threading.RLock()
+        self._version = None
+        self._revision = 0
+
+    df_bookings = _frame('df_bookings')
+    df_dates = _frame('df_dates')
+    df_hotels = _frame('df_hotels')
+    df_rooms = _frame('df_rooms')
+    df_aggregated_bookings = _frame('df_aggregated_bookings')
+    merged_bookings = _frame('merged_bookings')
+    df_merged_bookings = _frame('df_merged_bookings')
+    df_merged_agg_bookings = _frame('df_merged_agg_bookings')
+    capacity_cube = _frame('capacity_cube')
+    booking_cube = _frame('booking_cube')
+
+    # Build a value once even when several sessions ask for it at the same time
+    def _memo(self, cache, key, build):
+        value = cache.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            lock = self._locks.setdefault((id(cache), key), threading.Lock())
+        with lock:
+            value = cache.get(key)
+            if value is None:
+                value = build()
+                cache[key] = value
+        return value
+
+    # Return a frame, loading it on first use
+    def get(self, name):
+        frame = self._memo(self._frames, name, lambda: self._build(name))
+        if self._pending.get(name):
+            self._concat_pending(name)
+            frame = self._frames[name]
+        return frame
+
+    # Filter bitmaps of a frame, built on first use
+    def filter_index(self, name):
+        return self._indexed(name)[1]
+
+    # The frame and the index built for it, read together so an append in between can't mix them up
+    def _indexed(self, name):
+        if self._pending.get(name):
+            self.get(name)
+        return self._memo(self._indexes, name, lambda: (self.get(name), FilterIndex(self.get(name))))
+
+    # Rows of a frame matching the sidebar filters (room_class=..., city=..., 'All' for no filter).
+    # dates=(start, end) also keeps only the days in between (inclusive): the cubes are sorted by date,
+    # so that is two binary searches instead of comparing every row.
+    def filtered(self, name, dates=None, **filters):
+        frame, index = self._indexed(name)
+        positions = index.positions(**filters)
+        if dates is not None:
+            first = frame['date'].searchsorted(pd.Timestamp(dates[0]))
+            last = frame['date'].searchsorted(pd.Timestamp(dates[1]), side='right')
+            positions = positions[np.searchsorted(positions, first):np.searchsorted(positions, last)]
+        # A run of consecutive rows (every row, or a date range alone) of a frame mapped from a snapshot is a slice
+        # of it, not a copy. Its columns are read-only, so writing into the slice raises instead of changing the
+        # rows every session reads. Frames built in memory always hand out copies.
+        contiguous = len(positions) and positions[-1] - positions[0] + 1 == len(positions)
+        if contiguous and name in self._mapped:
+            return frame.iloc[positions[0]:positions[-1] + 1]
+        return frame.take(positions)
+
+    # Cumulative daily totals that answer any date range in two lookups (see hotel_prefix), built from the cubes
+    @property
+    def prefix_sums(self):
+        return self._memo(self._derived, 'prefix_sums', lambda: PrefixSums(self.booking_cube, self.capacity_cube))
+
+    # Stratified sample of the bookings for quick estimates (see hotel_preview), drawn on first use
+    @property
+    def preview_sample(self):
+        return self._memo(self._derived, 'preview_sample', lambda: PreviewSample(self._merged_booking_chunks()))
+
+    # Whether the preview sample is drawn (for the current data), so asking for it returns at once
+    def preview_ready(self):
+        return 'preview_sample' in self._derived
+
+    # The merged bookings chunk by chunk, appended batches included. Each chunk is read from the booking file
+    # and joined on its own, so neither the raw nor the merged bookings are loaded (or kept) for the sample.
+    def _merged_booking_chunks(self):
+        batches = self._appended('df_bookings')
+        chunks = read_chunks(TABLES['df_bookings'], self.chunksize or PREVIEW_CHUNKSIZE, self.data_dir)
+        return map(self._join, itertools.chain(chunks, batches))
+
+    # Batches of a raw frame appended since the store opened
+    def _appended(self, name):
+        with self._lock:
+            return [batch[name] for batch in self._batches if name in batch]
+
+    def _build(self, name):
+        if name in self._dropped:
+            return self._reread(name)
+        if name == 'df_dates':
+            return add_week_keys(load_table(TABLES[name], self.data_dir))
+        if name in TABLES:
+            return load_table(TABLES[name], self.data_dir)
+        if name in MERGED:
+            return enrich(self.get(MERGED[name]), self.df_rooms, self.df_hotels, self.df_dates)
+        if name in CUBES:
+            # The booking cube is built on the capacity cube: it is resolved before the append lock is taken, as a
+            # thread building it holds the capacity cube's lock and then waits for the append lock
+            if name == 'booking_cube':
+                self.capacity_cube
+            # No batch can land between the facts being read and dropped
+            with self._append_lock:
+                cube = self._build_cube(name) if self._revision else self._snapshot(name)
+                self._drop_sources(name)
+            return cube
+        raise KeyError(f'Unknown frame: {name}')
+
+    # Drop the facts and merged frame a cube was rolled up from, only the cube is served from then on.
+    # Appends stop queueing batches for the dropped facts, which are read again (batches included) if asked for.
+    def _drop_sources(self, name):
+        with self._lock:
+            for source in CUBE_SOURCES[name]:
+                self._frames.pop(source, None)
+                self._pending.pop(source, None)
+                self._indexes.pop(source, None)
+            self._dropped.add(CUBE_SOURCES[name][0])
+
+    # Dropped facts from their file plus every batch appended since the store opened
+    def _reread(self, name):
+        with self._lock:
+            self._dropped.discard(name)
+            batches = [batch[name] for batch in self._batches if name in batch]
+        facts = self._build(name)
+        return concat_frames([facts] + batches) if batches else facts
+
+    # The cubes of the cleaned files are mapped from a snapshot (see hotel_cache.read_snapshot): the first process
+    # to need one builds and writes it, the others only map it. A read-only data folder keeps the built cube.
+    # Snapshots are named after the data version and the cube layout, a change to either builds a new one.
+    def _snapshot(self, name):
+        path = snapshot_path(name, f'{self.version}_{layout_hash()}', self.data_dir)
+        if not os.path.exists(path):
+            cube = self._build_cube(name)
+            try:
+                write_snapshot(cube, path)
+            except OSError:
+                return cube
+        cube = read_snapshot(path)
+        self._mapped.add(name)
+        return cube
+
+    def _build_cube(self, name):
+        # Streamed from the files, with the batches appended since
+        if name == 'capacity_cube' and self.chunksize:
+            return stream_capacity_cube(self._join, self.chunksize, self.data_dir, self.workers,
+                                        self._appended('df_aggregated_bookings'))
+        if name == 'booking_cube' and self.chunksize:
+            return stream_booking_cube(self._join, self.capacity_cube, self.chunksize, self.data_dir, self.workers,
+                                       self._appended('df_bookings'))
+        if name == 'capacity_cube' and self.workers:
+            return parallel_capacity_cube(self.df_merged_agg_bookings, self.workers)
+        if name == 'booking_cube' and self.workers:
+            return parallel_booking_cube(self.df_merged_bookings, self.capacity_cube, self.workers)
+        if name == 'capacity_cube':
+            return build_capacity_cube(self.df_merged_agg_bookings)
+        if name == 'booking_cube':
+            return build_booking_cube(self.df_merged_bookings, self.capacity_cube)
+        raise KeyError(f'Unknown frame: {name}')
+
+    # Join a chunk of facts with the dimensions of the store
+    def _join(self, facts):
+        return enrich(facts, self.df_rooms, self.df_hotels, self.df_dates)
+
+    # Identifies the data behind the store (size and mtime of every source file, plus the batches
+    # appended since), so results computed from other data are never reused
+    @property
+    def version(self):
+        if self._version is None:
+            self._version = source_version(TABLES.values(), self.data_dir)
+        return f'{self._version}+{self._revision}' if self._revision else self._version
+
+    # Add a batch of new bookings and/or aggregated bookings, given as rows shaped like the cleaned csv files.
+    # Raw frames (and merged frames already joined) get the batch as a chunk that is concatenated on their next
+    # read, the cubes and their filter indexes are updated from the batch's first date on, so the cost follows
+    # the batch size and the history is never loaded just to append to it.
+    def append(self, bookings=None, aggregated_bookings=None):
+        batches = {}
+        if aggregated_bookings is not None:
+            batches['df_aggregated_bookings'] = apply_schema(aggregated_bookings, 'fact_aggregated_bookings')
+        if bookings is not None:
+            batches['df_bookings'] = apply_schema(bookings, 'fact_bookings')
+        if not batches:
+            return self
+
+        # A booking cube is updated against the capacity cube, which is loaded (outside the append lock, see _build)
+        # if only the booking cube was read, e.g. mapped from its snapshot
+        if self.is_loaded('booking_cube'):
+            self.capacity_cube
+        with self._append_lock:
+            merged = {}
+            for name, facts in MERGED.items():
+                if facts in batches:
+                    merged[name] = self._join(batches[facts])
+            since = min(batch['check_in_date'].min() for batch in batches.values())
+
+            cubes = {}
+            if self.is_loaded('capacity_cube'):
+                cubes['capacity_cube'] = (self.capacity_cube, 0)
+                if 'df_merged_agg_bookings' in merged:
+                    batch_cube = build_capacity_cube(merged['df_merged_agg_bookings'])
+                    cubes['capacity_cube'] = update_capacity_cube(self.capacity_cube, batch_cube, since)
+            if self.is_loaded('booking_cube'):
+                batch_cube = rollup_bookings(merged['df_merged_bookings']) if 'df_merged_bookings' in merged else None
+                cubes['booking_cube'] = update_booking_cube(
+                    self.booking_cube, batch_cube, cubes['capacity_cube'][0], since)
+
+            with self._lock:
+                # A merged frame that isn't loaded yet will be joined from its raw frame, batch included
+                for name, batch in batches.items():
+                    if name not in self._dropped:
+                        self._pending.setdefault(name, []).append(batch)
+                for name, batch in merged.items():
+                    if name in self._frames:
+                        self._pending.setdefault(name, []).append(batch)
+                for name, (cube, start) in cubes.items():
+                    indexed = self._indexes.get(name)
+                    self._frames[name] = cube
+                    self._mapped.discard(name)
+                    if indexed is not None:
+                        self._indexes[name] = (cube, indexed[1].updated(cube, start))
+                self._derived.clear()
+                self._batches.append(batches)
+                self._revision += 1
+        return self
+
+    # Fold the appended chunks of a loaded frame into it
+    def _concat_pending(self, name):
+        with self._lock:
+            chunks = self._pending.pop(name, None)
+            if chunks:
+                self._frames[name] = concat_frames([self._frames[name]] + chunks)
+                self._indexes.pop(name, None)
+
+    def is_loaded(self, name):
+        return name in self._frames
+
+    # Memory held by the frames loaded so far
+    def memory_report(self):
+        return memory_report(dict(self._frames))
+
+    # Preload frames ahead of the first request (all of them by default)
+    def warm(self, names=FRAMES):
+        for name in names:
+            self.get(name)
+        return self
@@ -0,0 +1,47 @@
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+from hotel_cube import (BOOKING_KEYS, BOOKING_MEASURES, CAPACITY_KEYS, CAPACITY_MEASURES, add_room_day_measures,
+                        build_capacity_cube, combine_cubes, rollup_bookings)
+from hotel_schema import DATA_DIR, read_chunks
+
+# Rows read from a fact file at a time in streaming mode
+CHUNKSIZE = 500_000
+
+
+# Fold a fact file into a cube one chunk at a time. Each chunk is joined with the dimensions and rolled up
+# on its own, and the partial cubes are merged whenever they add up to more rows than a chunk,
+# so memory stays bounded by the chunk size and the cube instead of the size of the file.
+# With workers the chunk rollups run in a process pool, one chunk in flight per worker.
+# batches are facts appended after the file was written, folded in after its chunks.
+def stream_cube(name, join, rollup, keys, measures, chunksize=CHUNKSIZE, data_dir=DATA_DIR, workers=None,
+                batches=()):
+    partials = []
+    with ProcessPoolExecutor(workers) if workers else nullcontext() as pool:
+        running = deque()
+        for chunk in itertools.chain(read_chunks(name, chunksize, data_dir), batches):
+            if pool is None:
+                partials.append(rollup(join(chunk)))
+            else:
+                running.append(pool.submit(rollup, join(chunk)))
+                while len(running) > workers:
+                    partials.append(running.popleft().result())
+            if len(partials) > 1 and sum(len(partial) for partial in partials) > chunksize:
+                partials = [combine_cubes(partials, keys, measures)]
+        partials.extend(future.result() for future in running)
+    return combine_cubes(partials, keys, measures)
+
+
+# Capacity cube streamed from fact_aggregated_bookings, join turns a chunk of facts into merged rows
+def stream_capacity_cube(join, chunksize=CHUNKSIZE, data_dir=DATA_DIR, workers=None, batches=()):
+    return stream_cube('fact_aggregated_bookings', join, build_capacity_cube, CAPACITY_KEYS, CAPACITY_MEASURES,
+                       chunksize, data_dir, workers, batches)
+
+
+# Booking cube streamed from fact_bookings, the room day measures come from the finished capacity cube
+def stream_booking_cube(join, capacity_cube, chunksize=CHUNKSIZE, data_dir=DATA_DIR, workers=None, batches=()):
+    cube = stream_cube('fact_bookings', join, rollup_bookings, BOOKING_KEYS, BOOKING_MEASURES, chunksize, data_dir,
+                       workers, batches)
+    return add_room_day_measures(cube, capacity_cube)
@@ -0,0 +1,150 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from hotel_schema import DATE_COLUMNS, SCHEMAS
+
+# Brands, categories and cities the generated hotels are drawn from, every city gets each brand once
+BRANDS = [
+    ('Atliq Grands', 'Luxury'), ('Atliq Exotica', 'Luxury'), ('Atliq City', 'Business'), ('Atliq Blu', 'Luxury'),
+    ('Atliq Bay', 'Luxury'), ('Atliq Palace', 'Business'), ('Atliq Seasons', 'Business'),
+]
+CITIES = ['Delhi', 'Mumbai', 'Hyderabad', 'Bangalore', 'Chennai', 'Pune', 'Kolkata', 'Jaipur', 'Ahmedabad', 'Kochi']
+ROOMS = [('RT1', 'Standard'), ('RT2', 'Elite'), ('RT3', 'Premium'), ('RT4', 'Presidential')]
+
+# Share of bookings per platform and status, and the nightly rate range of each room class
+PLATFORMS = {
+    'others': 0.41, 'makeyourtrip': 0.2, 'logtrip': 0.11, 'direct online': 0.1, 'tripster': 0.07,
+    'journey': 0.06, 'direct offline': 0.05,
+}
+STATUSES = {'Checked Out': 0.7, 'Cancelled': 0.25, 'No Show': 0.05}
+RATES = {'RT1': (6500, 10000), 'RT2': (9000, 15000), 'RT3': (12000, 24000), 'RT4': (19000, 45000)}
+
+# Occupancy the capacity is sized for, so the generated bookings land close to the requested count
+OCCUPANCY = 0.58
+
+
+# Write a frame as (part of) a cleaned csv, dates in the format the schema declares for them
+def _write(df, name, out_dir, append=False):
+    df = df.copy()
+    for column, date_format in DATE_COLUMNS[name].items():
+        if column in df.columns:
+            # Only a few hundred distinct dates, each one is formatted once
+            codes, dates = pd.factorize(df[column])
+            formatted = pd.DatetimeIndex(dates).strftime('%Y-%m-%d' if date_format == 'ISO8601' else date_format)
+            df[column] = np.asarray(formatted)[codes]
+    df = df[[column for column in df.columns if column in SCHEMAS[name] or column in DATE_COLUMNS[name]]]
+    df.to_csv(os.path.join(out_dir, f'{name}.csv'), mode='a' if append else 'w', header=not append, index=False)
+
+
+def make_dates(start, days):
+    dates = pd.Series(pd.date_range(start, periods=days, freq='D'))
+    return pd.DataFrame({
+        'date': dates,
+        'mmm_yy': dates.dt.strftime('%b %y'),
+        # Weeks start on Sunday and the week holding January 1st is week 1
+        'week_no': 'W ' + (dates.dt.strftime('%U').astype(int) + 1).astype(str),
+        'day_type': np.where(dates.dt.dayofweek >= 5, 'weekend', 'weekday'),
+    })
+
+
+# Hotels numbered like the originals (16558 + 1000 per city + brand), cycling brands over as many cities as needed
+def make_hotels(properties):
+    rows = []
+    for i in range(properties):
+        city, brand = divmod(i, len(BRANDS))
+        name, category = BRANDS[brand]
+        city_name = CITIES[city % len(CITIES)] + (f' {city // len(CITIES) + 1}' if city >= len(CITIES) else '')
+        rows.append({'property_id': 16558 + city * 1000 + brand, 'property_name': name, 'category': category,
+                     'city': city_name})
+    return pd.DataFrame(rows)
+
+
+def make_rooms():
+    return pd.DataFrame(ROOMS, columns=['room_id', 'room_class'])
+
+
+# Aggregated bookings of a block of days: capacity per property and room, successful bookings drawn around
+# the target occupancy with busier weekends
+def make_aggregated_bookings(rng, df_dates, df_hotels, capacities):
+    cells = pd.MultiIndex.from_product(
+        [df_dates['date'], df_hotels['property_id'], [room for room, _ in ROOMS]],
+        names=['check_in_date', 'property_id', 'room_category'],
+    ).to_frame(index=False)
+    capacity = np.tile(capacities.ravel(), len(df_dates))
+    weekend = np.repeat((df_dates['date'].dt.dayofweek >= 5).to_numpy(), capacities.size)
+    occupancy = np.clip(rng.normal(OCCUPANCY, 0.12, len(cells)) + np.where(weekend, 0.08, -0.03), 0.05, 1)
+    cells['successful_bookings'] = np.maximum(rng.binomial(capacity, occupancy), 1)
+    cells['capacity'] = capacity
+    return cells[['property_id', 'check_in_date', 'room_category', 'successful_bookings', 'capacity']]
+
+
+# One booking per successful booking of every aggregated cell, so both fact tables stay consistent
+def make_bookings(rng, aggregated, first_id):
+    counts = aggregated['successful_bookings'].to_numpy()
+    n = int(counts.sum())
+    cells = aggregated.loc[aggregated.index.repeat(counts)].reset_index(drop=True)
+    check_in = cells['check_in_date']
+    room = cells['room_category'].to_numpy()
+    room_codes = pd.Categorical(room, categories=list(RATES)).codes
+    low, high = np.array(list(RATES.values())).T
+
+    status = rng.choice(list(STATUSES), n, p=list(STATUSES.values()))
+    generated = rng.integers(low[room_codes], high[room_codes])
+    realized = np.where(status == 'Cancelled', (generated * 0.4).astype(int), generated)
+    rated = (status == 'Checked Out') & (rng.random(n) < 0.42)
+
+    return pd.DataFrame({
+        'booking_id': 'B' + pd.Series(np.arange(first_id, first_id + n)).astype(str),
+        'property_id': cells['property_id'],
+        'booking_date': check_in - pd.to_timedelta(rng.geometric(0.12, n) - 1, unit='D'),
+        'check_in_date': check_in,
+        'checkout_date': check_in + pd.to_timedelta(rng.integers(1, 6, n), unit='D'),
+        'no_guests': rng.integers(1, 5, n).astype('float32'),
+        'room_category': room,
+        'booking_platform': rng.choice(list(PLATFORMS), n, p=list(PLATFORMS.values())),
+        'ratings_given': np.where(rated, rng.integers(1, 6, n), np.nan),
+        'booking_status': status,
+        'revenue_generated': generated,
+        'revenue_realized': realized,
+    })
+
+
+# Write a full set of cleaned datasets: the three dimensions plus both fact tables sized for about `bookings`
+# bookings. The facts are generated and appended a block of days at a time, so memory follows block_days.
+def generate(out_dir, bookings=1_000_000, properties=25, days=92, start='2022-05-01', seed=0, block_days=31):
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    df_dates = make_dates(start, days)
+    df_hotels = make_hotels(properties)
+    _write(df_dates, 'dim_date', out_dir)
+    _write(df_hotels, 'dim_hotels', out_dir)
+    _write(make_rooms(), 'dim_room', out_dir)
+
+    mean_capacity = bookings / (properties * len(ROOMS) * days * OCCUPANCY)
+    capacities = np.maximum(rng.poisson(mean_capacity, (properties, len(ROOMS))), 1)
+
+    written = 0
+    for first_day in range(0, days, block_days):
+        block = df_dates.iloc[first_day:first_day + block_days]
+        aggregated = make_aggregated_bookings(rng, block, df_hotels, capacities)
+        facts = make_bookings(rng, aggregated, written)
+        _write(aggregated, 'fact_aggregated_bookings', out_dir, append=first_day > 0)
+        _write(facts, 'fact_bookings', out_dir, append=first_day > 0)
+        written += len(facts)
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate synthetic cleaned hotel datasets')
+    parser.add_argument('out_dir')
+    parser.add_argument('--bookings', type=int, default=1_000_000)
+    parser.add_argument('--properties', type=int, default=25)
+    parser.add_argument('--days', type=int, default=92)
+    parser.add_argument('--start', default='2022-05-01')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    count = generate(args.out_dir, args.bookings, args.properties, args.days, args.start, args.seed)
+    print(f'{count} bookings written to {args.out_dir}')
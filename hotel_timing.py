@@ -0,0 +1,121 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+# Timings are logged here as one json object per stage
+logger = logging.getLogger('hotel_timing')
+
+# HOTEL_TIMING=1 times every stage on every thread, otherwise only reruns that start() with the panel on
+ENABLED = os.environ.get('HOTEL_TIMING', '') not in ('', '0')
+
+_local = threading.local()
+
+
+def _active():
+    return getattr(_local, 'active', ENABLED)
+
+
+# A running stage. It is recorded in the order stages start, with its nesting depth, and gets its duration
+# and the rows it worked on when it ends.
+class _Stage:
+    def __init__(self, name):
+        self.record = {'stage': name, 'ms': None, 'rows': None, 'depth': 0}
+
+    def count(self, rows):
+        self.record['rows'] = rows
+
+    def __enter__(self):
+        depth = getattr(_local, 'depth', 0)
+        self.record['depth'] = depth
+        _local.depth = depth + 1
+        records = getattr(_local, 'records', None)
+        if records is not None:
+            records.append(self.record)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.record['ms'] = round((time.perf_counter() - self.start) * 1000, 3)
+        _local.depth = self.record['depth']
+        logger.info(json.dumps(self.record))
+        return False
+
+
+# Stand-in for a stage while timing is off
+class _NoStage:
+    def count(self, rows):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+# Time a named block: with stage('filter') as s: ...; s.count(len(rows))
+def stage(name):
+    return _Stage(name) if _active() else _NO_STAGE
+
+
+def _rows(args):
+    for arg in args:
+        if hasattr(arg, 'shape'):
+            return len(arg)
+    return None
+
+
+# Time every call of a function as a stage named after it, counting the rows of its first frame argument
+def timed(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _active():
+            return function(*args, **kwargs)
+        with _Stage(function.__name__) as timer:
+            timer.count(_rows(args))
+            return function(*args, **kwargs)
+    return wrapper
+
+
+# Wrap a function to run on another thread (a pool worker) with the timing state of the calling thread,
+# so its stages land in the caller's records
+def in_context(function):
+    active = _active()
+    records = getattr(_local, 'records', None)
+    depth = getattr(_local, 'depth', 0)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        saved = _local.__dict__.copy()
+        _local.active, _local.records, _local.depth = active, records, depth
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _local.__dict__.clear()
+            _local.__dict__.update(saved)
+    return wrapper
+
+
+# Start recording the stages of this thread (one app rerun), panel turns timing on for it
+def start(panel=False):
+    _local.active = panel or ENABLED
+    _local.records = []
+    _local.depth = 0
+    _local.started = time.perf_counter()
+
+
+# Stages recorded on this thread since start(), in the order they started, plus the total
+def collect():
+    records = getattr(_local, 'records', None) or []
+    started = getattr(_local, 'started', None)
+    if started is not None:
+        records.append({'stage': 'total', 'ms': round((time.perf_counter() - started) * 1000, 3),
+                        'rows': None, 'depth': 0})
+    _local.records = []
+    return records
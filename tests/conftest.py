@@ -0,0 +1,62 @@
+import os
+import shutil
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hotel_cube import BOOKING_KEYS, CAPACITY_KEYS  # noqa: E402
+from hotel_store import CUBES, HotelDataStore  # noqa: E402
+from hotel_synth import generate  # noqa: E402
+
+# The generated days run from 2022-05-01 to 2022-06-29: the history stops here and the later rows are appended
+CUT = pd.Timestamp('2022-06-10')
+
+FACTS = {'bookings': 'fact_bookings.csv', 'aggregated_bookings': 'fact_aggregated_bookings.csv'}
+
+
+# A small set of cleaned datasets, generated once for the whole run
+@pytest.fixture(scope='session')
+def generated(tmp_path_factory):
+    out_dir = tmp_path_factory.mktemp('generated')
+    generate(str(out_dir), bookings=6000, properties=4, days=60, block_days=20)
+    return out_dir
+
+
+# A copy of the datasets for one test, caches and snapshots are written next to the files
+@pytest.fixture
+def data_dir(generated, tmp_path):
+    return str(shutil.copytree(generated, tmp_path / 'full'))
+
+
+# The cubes of the full files built the plain way (no chunks, no workers), what every other way must match
+@pytest.fixture(scope='session')
+def full_store(generated, tmp_path_factory):
+    reference_dir = shutil.copytree(generated, tmp_path_factory.mktemp('reference') / 'full')
+    return HotelDataStore(str(reference_dir)).warm(CUBES)
+
+
+# A copy holding the facts checked in before CUT, and the later rows (as read from the cleaned files) to append
+@pytest.fixture
+def history(generated, tmp_path):
+    history_dir = shutil.copytree(generated, tmp_path / 'history')
+    batches = {}
+    for name, file_name in FACTS.items():
+        facts = pd.read_csv(history_dir / file_name)
+        later = pd.to_datetime(facts['check_in_date']) >= CUT
+        facts[~later].to_csv(history_dir / file_name, index=False)
+        batches[name] = facts[later].reset_index(drop=True)
+    return str(history_dir), batches
+
+
+# Cubes hold the same cells whatever order they were built in, compared cell by cell
+def assert_same_cube(actual, expected, name):
+    keys = BOOKING_KEYS if name == 'booking_cube' else CAPACITY_KEYS
+
+    def cells(cube):
+        cube = cube.astype({column: str for column in keys if isinstance(cube[column].dtype, pd.CategoricalDtype)})
+        return cube.sort_values(keys).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(cells(actual), cells(expected), check_dtype=False)
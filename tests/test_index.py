@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+from hotel_index import FILTER_COLUMNS, FilterIndex
+from hotel_schema import concat_frames
+
+
+# An index updated from any row on (a byte boundary of the bitmaps or not) answers every filter like an index
+# built on the new frame, values only the old or only the new rows hold included
+@pytest.mark.parametrize('start', [0, 8, 13])
+def test_updated_matches_fresh_index(full_store, start):
+    cube = full_store.booking_cube
+    old = cube.iloc[:len(cube) // 2]
+    new = concat_frames([old.iloc[:start], cube.iloc[len(cube) // 4:]])
+    updated = FilterIndex(old).updated(new, start)
+    fresh = FilterIndex(new)
+
+    for column in FILTER_COLUMNS:
+        for value in set(old[column]) | set(new[column]):
+            np.testing.assert_array_equal(updated.positions(**{column: value}), fresh.positions(**{column: value}))
+    np.testing.assert_array_equal(updated.positions(), np.arange(len(new)))
@@ -0,0 +1,37 @@
+import sqlite3
+
+import hotel_analysis
+from hotel_memo import PrecomputedResults, precomputed_path
+from hotel_precompute import filter_values, precompute
+from hotel_store import HotelDataStore
+
+
+def _rows(path):
+    with sqlite3.connect(path) as connection:
+        return set(connection.execute('SELECT version, name, key, value FROM results'))
+
+
+# A run interrupted part way (some groups never committed) is picked up by the next one, which only computes the
+# missing groups and leaves the same results as a run that was never interrupted
+def test_precompute_resumes(data_dir, capsys):
+    version = precompute(data_dir, workers=1)
+    path = precomputed_path(data_dir)
+    complete = _rows(path)
+    with sqlite3.connect(path) as connection:
+        connection.execute("DELETE FROM results WHERE key LIKE '[\"Jun 22\", \"Elite\"%'")
+    capsys.readouterr()
+
+    assert precompute(data_dir, workers=1) == version
+    assert _rows(path) == complete
+    # Only the groups of June and Elite rooms (one per city filter) are computed again
+    store = HotelDataStore(data_dir)
+    months, room_types, cities, _ = filter_values(store)
+    total = len(months) * len(room_types) * len(cities)
+    output = capsys.readouterr().out
+    assert f'{total - len(cities)} of {total} groups already done' in output
+    assert f'{len(cities)}/{len(cities)} groups written' in output
+
+    # What is served is what the dashboard would compute
+    selection = hotel_analysis.Selection('Jun 22', 'Elite', 'All', 'All', data_store=store)
+    served = PrecomputedResults(path).get(store.version, 'metric_cards', selection.key)
+    assert served == hotel_analysis.metric_cards(selection)
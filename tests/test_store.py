@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from conftest import assert_same_cube
+
+from hotel_store import CUBES, HotelDataStore
+
+
+def _split(rows, parts):
+    return [rows.iloc[positions] for positions in np.array_split(np.arange(len(rows)), parts)]
+
+
+# The appends of each ordering, as the keyword arguments of every call
+def _appends(ordering, batches):
+    bookings, aggregated = batches['bookings'], batches['aggregated_bookings']
+    if ordering == 'together':
+        return [{'bookings': bookings, 'aggregated_bookings': aggregated}]
+    if ordering == 'bookings_first':
+        return [{'bookings': bookings}, {'aggregated_bookings': aggregated}]
+    if ordering == 'aggregated_first':
+        return [{'aggregated_bookings': aggregated}, {'bookings': bookings}]
+    # Several batches of each, interleaved
+    return [{name: part} for pair in zip(_split(bookings, 3), _split(aggregated, 3))
+            for name, part in zip(('bookings', 'aggregated_bookings'), pair)]
+
+
+# Appending the later rows gives the cubes of the full files, whatever the order of the batches and whether the
+# cubes were loaded (and are updated in place) or are built after the appends (from the files plus the batches)
+@pytest.mark.parametrize('loaded', [True, False], ids=['cubes_loaded', 'cubes_built_after'])
+@pytest.mark.parametrize('ordering', ['together', 'bookings_first', 'aggregated_first', 'split'])
+def test_append_matches_full_files(history, full_store, ordering, loaded):
+    history_dir, batches = history
+    store = HotelDataStore(history_dir)
+    if loaded:
+        store.warm(CUBES)
+    for batch in _appends(ordering, batches):
+        store.append(**batch)
+
+    for cube in CUBES:
+        assert_same_cube(store.get(cube), full_store.get(cube), cube)
+    assert len(store.df_bookings) == len(full_store.df_bookings)
+    assert len(store.df_merged_agg_bookings) == len(full_store.df_merged_agg_bookings)
+
+
+# Only the booking cube read, mapped from the snapshot an earlier process wrote: an append still updates it
+# against the capacity cube, and both cubes end up as if built from the full files
+def test_append_to_booking_cube_mapped_alone(history, full_store):
+    history_dir, batches = history
+    HotelDataStore(history_dir).warm(CUBES)
+    store = HotelDataStore(history_dir)
+    store.booking_cube
+    store.append(**batches)
+
+    for cube in CUBES:
+        assert_same_cube(store.get(cube), full_store.get(cube), cube)
+
+
+# The filter index of a cube updated by an append answers like one built on the new cube
+def test_append_updates_filter_index(history):
+    history_dir, batches = history
+    store = HotelDataStore(history_dir)
+    for cube in CUBES:
+        store.filter_index(cube)
+    store.append(**batches)
+
+    for cube in CUBES:
+        frame = store.get(cube)
+        for filters in ({}, {'city': frame['city'].iloc[-1]}, {'room_class': 'Elite', 'mmm_yy': 'Jun 22'}):
+            expected = np.flatnonzero(np.all([frame[column] == value for column, value in filters.items()], axis=0)) \
+                if filters else np.arange(len(frame))
+            np.testing.assert_array_equal(store.filter_index(cube).positions(**filters), expected)
+
+
+# Cubes streamed chunk by chunk, rolled up on workers or both are the cubes built in one pass, before and after
+# an append
+@pytest.mark.parametrize('options', [{'chunksize': 700}, {'workers': 2}, {'chunksize': 700, 'workers': 2}],
+                         ids=['chunks', 'workers', 'chunks_and_workers'])
+def test_streamed_and_parallel_cubes(data_dir, history, full_store, options):
+    store = HotelDataStore(data_dir, **options)
+    for cube in CUBES:
+        assert_same_cube(store.get(cube), full_store.get(cube), cube)
+
+    history_dir, batches = history
+    store = HotelDataStore(history_dir, **options)
+    store.append(**batches)
+    for cube in CUBES:
+        assert_same_cube(store.get(cube), full_store.get(cube), cube)